@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+MagicRenamer benchmarks
+
+Usage:
+    python benchmark.py              # run every benchmark
+    python benchmark.py startup      # server import/startup time
+    python benchmark.py overhead     # fixed per-job overhead of /process
+    python benchmark.py quality      # resize quality tiers: speed and SSIM vs. "best"
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def timed_subprocess(code, runs):
+    """Median wall time of a fresh interpreter running code"""
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], cwd=HERE, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def bench_startup(runs):
+    """Import time of the server module vs. the heavy imports it now defers"""
+    baseline = timed_subprocess('pass', runs)
+    server = timed_subprocess('import magicrenamer_web', runs)
+    heavy = timed_subprocess('import PIL.Image, smartcrop', runs)
+    health = timed_subprocess(
+        'import magicrenamer_web as m; m.app.test_client().get("/health")', runs)
+
+    print('--- Startup ---')
+    print(f'interpreter:                 {baseline * 1000:8.1f} ms')
+    print(f'import magicrenamer_web:     {(server - baseline) * 1000:8.1f} ms')
+    print(f'PIL + smartcrop (deferred):  {(heavy - baseline) * 1000:8.1f} ms')
+    print(f'first /health (detection):   {(health - server) * 1000:8.1f} ms')
+
+
+def run_job(client, directory, files, **options):
+    """Run one /process job to completion and return (seconds, complete event)"""
+    payload = dict(directory=directory, files=files, **options)
+    start = time.perf_counter()
+    response = client.post('/process', json=payload)
+    events = [json.loads(line[6:]) for line in response.get_data(as_text=True).splitlines()
+              if line.startswith('data: ')]
+    elapsed = time.perf_counter() - start
+    complete = next((e for e in events if e.get('complete')), None)
+    error = next((e['error'] for e in events if 'error' in e), None)
+    if complete is None:
+        raise RuntimeError(f'Job failed: {error}')
+    return elapsed, complete
+
+
+def bench_overhead(runs):
+    """Fixed cost of a /process job beyond the conversion itself"""
+    sys.path.insert(0, HERE)
+    import magicrenamer_web as mr
+    from PIL import Image
+
+    client = mr.app.test_client()
+    options = {'resize_size': '64', 'crop_mode': 'smart'}
+    job_times, convert_times = [], []
+
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, 'source.png')
+        Image.new('RGB', (64, 64), (200, 120, 40)).save(source)
+
+        for run in range(runs + 1):
+            sample = os.path.join(directory, 'sample.png')
+            Image.open(source).save(sample)
+
+            start = time.perf_counter()
+            mr.resize_smart_crop(source, os.path.join(directory, 'direct.png'), 64)
+            convert_time = time.perf_counter() - start
+
+            elapsed, _ = run_job(client, directory, ['sample.png'], prefix='bench', **options)
+            os.remove(os.path.join(directory, 'bench-1.png'))
+            if run == 0:
+                first = elapsed - convert_time
+                continue
+            job_times.append(elapsed)
+            convert_times.append(convert_time)
+
+    print('--- Per-job overhead (1 tiny image, smart crop) ---')
+    print(f'first job overhead:          {first * 1000:8.1f} ms')
+    print(f'warm job total:              {statistics.median(job_times) * 1000:8.1f} ms')
+    print(f'warm conversion only:        {statistics.median(convert_times) * 1000:8.1f} ms')
+    print(f'warm fixed overhead:         {(statistics.median(job_times) - statistics.median(convert_times)) * 1000:8.1f} ms')
+
+
+def synthetic_photo(width, height, seed=0):
+    """Photo-like test image: smooth gradients, fine texture and hard edges"""
+    import numpy as np
+    from PIL import Image, ImageDraw
+
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    base = np.stack([
+        128 + 100 * np.sin(x / 97.0) * np.cos(y / 131.0),
+        128 + 90 * np.sin((x + y) / 53.0),
+        128 + 80 * np.cos(x / 17.0) * np.sin(y / 23.0),
+    ], axis=-1)
+    base += rng.normal(0, 12, base.shape)
+    img = Image.fromarray(np.clip(base, 0, 255).astype(np.uint8), 'RGB')
+    draw = ImageDraw.Draw(img)
+    for _ in range(60):
+        x0, y0 = int(rng.integers(0, width)), int(rng.integers(0, height))
+        size = int(rng.integers(20, max(21, width // 8)))
+        draw.rectangle((x0, y0, x0 + size, y0 + size // 2), fill=tuple(int(v) for v in rng.integers(0, 255, 3)))
+    return img
+
+
+def ssim(a, b, window=7):
+    """Mean structural similarity of two same-sized images (luma, box window)"""
+    import numpy as np
+
+    def luma(img):
+        return np.asarray(img.convert('L'), dtype=np.float64)
+
+    def box(values):
+        # Mean over every window x window patch via an integral image
+        integral = np.pad(values.cumsum(0).cumsum(1), ((1, 0), (1, 0)))
+        total = (integral[window:, window:] - integral[:-window, window:]
+                 - integral[window:, :-window] + integral[:-window, :-window])
+        return total / (window * window)
+
+    x, y = luma(a), luma(b)
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    mu_x, mu_y = box(x), box(y)
+    var_x = box(x * x) - mu_x ** 2
+    var_y = box(y * y) - mu_y ** 2
+    cov = box(x * y) - mu_x * mu_y
+    ssim_map = ((2 * mu_x * mu_y + c1) * (2 * cov + c2)) / ((mu_x ** 2 + mu_y ** 2 + c1) * (var_x + var_y + c2))
+    return float(ssim_map.mean())
+
+
+def bench_quality(runs, source_size=(6000, 4000), target=512):
+    """Speed and similarity to "best" of each resize quality tier, for both backends"""
+    sys.path.insert(0, HERE)
+    import magicrenamer_web as mr
+    from PIL import Image
+
+    source = synthetic_photo(*source_size)
+    box = mr.center_crop_box(source.width, source.height, target, target)
+    cropped = source.crop((box[0], box[1], box[0] + box[2], box[1] + box[3]))
+
+    print(f'--- Resize quality tiers ({source_size[0]}x{source_size[1]} -> {target}x{target}) ---')
+    print('Pillow (smart crop path):')
+    results = {}
+    for quality in reversed(mr.QUALITY_TIERS):
+        times = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            results[quality] = mr.pil_resize(cropped, (target, target), quality)
+            times.append(time.perf_counter() - start)
+        results[quality + '_time'] = statistics.median(times)
+    for quality in reversed(mr.QUALITY_TIERS):
+        best_time = results['best_time']
+        print(f'  {quality:9s} {results[quality + "_time"] * 1000:8.1f} ms  '
+              f'{best_time / results[quality + "_time"]:5.1f}x  '
+              f'SSIM {ssim(results[quality], results["best"]):.4f}')
+
+    if not mr.get_capabilities()['magick']:
+        print('ImageMagick: not found, skipped')
+        return
+
+    print('ImageMagick (center crop path):')
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'source.png')
+        source.save(path, compress_level=1)
+        outputs, times = {}, {}
+        for quality in reversed(mr.QUALITY_TIERS):
+            output = os.path.join(directory, f'{quality}.png')
+            samples = []
+            for _ in range(runs):
+                start = time.perf_counter()
+                mr.resize_center_crop(path, output, target, quality=quality)
+                samples.append(time.perf_counter() - start)
+            times[quality] = statistics.median(samples)
+            with Image.open(output) as img:
+                outputs[quality] = img.convert('RGB')
+        for quality in reversed(mr.QUALITY_TIERS):
+            print(f'  {quality:9s} {times[quality] * 1000:8.1f} ms  '
+                  f'{times["best"] / times[quality]:5.1f}x  '
+                  f'SSIM {ssim(outputs[quality], outputs["best"]):.4f}')
+
+
+BENCHMARKS = {
+    'startup': bench_startup,
+    'overhead': bench_overhead,
+    'quality': bench_quality,
+}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='MagicRenamer benchmarks')
+    parser.add_argument('benchmarks', nargs='*', metavar='benchmark',
+                        help=f"benchmarks to run: {', '.join(BENCHMARKS)} (default: all)")
+    parser.add_argument('--runs', type=int, default=5, help='repetitions per measurement')
+    args = parser.parse_args()
+    unknown = [name for name in args.benchmarks if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark: {', '.join(unknown)}")
+
+    for name in args.benchmarks or BENCHMARKS:
+        BENCHMARKS[name](args.runs)
+        print()
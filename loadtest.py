@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+"""
+MagicRenamer load test
+
+Starts magicrenamer_web.py on a free port (or targets --url), generates an
+image corpus and runs concurrent /scan, /browse, /image and /process clients
+against it. Reports latency percentiles, error rates, SSE event lag and the
+CPU and memory of the server and its worker processes.
+
+Usage:
+    python loadtest.py                                   # default mix for 30 s
+    python loadtest.py --mix image=32,process=4 --duration 60
+    python loadtest.py --url http://host:5000 --pid 1234 # existing server
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+KINDS = ('scan', 'browse', 'image', 'process')
+
+
+def make_corpus(directory, count, size, seed=0):
+    """count JPEGs of the given size with enough detail to cost real encode time"""
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    for i in range(count):
+        img = Image.new('RGB', size, tuple(rng.randrange(256) for _ in range(3)))
+        draw = ImageDraw.Draw(img)
+        for _ in range(40):
+            x, y = rng.randrange(size[0]), rng.randrange(size[1])
+            draw.ellipse((x, y, x + rng.randrange(20, 200), y + rng.randrange(20, 200)),
+                         fill=tuple(rng.randrange(256) for _ in range(3)))
+        img.save(os.path.join(directory, f'img_{i:05d}.jpg'), quality=90)
+    return sorted(os.listdir(directory))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(port, cache_dir):
+    """Run the app in a subprocess (so its CPU/RSS can be sampled) and wait for /health"""
+    env = dict(os.environ, MAGICRENAMER_CROP_CACHE=os.path.join(cache_dir, 'crops.sqlite3'))
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(HERE, 'magicrenamer_web.py'), '--host', '127.0.0.1', '--port', str(port)],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/health')
+            if conn.getresponse().status == 200:
+                return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError('Server did not come up')
+
+
+class ProcessSampler(threading.Thread):
+    """Samples CPU time and memory of a process and all its descendants from /proc at a fixed interval"""
+
+    def __init__(self, pid, interval=0.5):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self.stopped = threading.Event()
+        self.ticks = os.sysconf('SC_CLK_TCK')
+        self.page_mb = os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+
+    @staticmethod
+    def stat(pid):
+        with open(f'/proc/{pid}/stat') as f:
+            return f.read().rsplit(')', 1)[1].split()
+
+    def tree(self):
+        """The sampled pid plus every live descendant (worker pool, forkserver, magick)"""
+        children = {}
+        for entry in os.listdir('/proc'):
+            if entry.isdigit():
+                try:
+                    children.setdefault(int(self.stat(entry)[1]), []).append(int(entry))
+                except (OSError, IndexError, ValueError):
+                    continue
+        pids, pending = [], [self.pid]
+        while pending:
+            pid = pending.pop()
+            pids.append(pid)
+            pending.extend(children.get(pid, ()))
+        return pids
+
+    def memory(self, pid, fields):
+        # Proportional set size splits shared pages between forked workers, so the
+        # tree total isn't inflated by counting the preloaded modules once per worker
+        try:
+            with open(f'/proc/{pid}/smaps_rollup') as f:
+                return next(int(line.split()[1]) for line in f if line.startswith('Pss:')) / 1024
+        except (OSError, StopIteration):
+            return int(fields[21]) * self.page_mb
+
+    def read(self):
+        server_cpu = server_rss = None
+        cpu = rss = 0.0
+        pids = self.tree()
+        for pid in pids:
+            try:
+                fields = self.stat(pid)
+                # utime + stime, plus cutime + cstime for children already reaped
+                # (short-lived magick runs, recycled workers)
+                used = sum(int(n) for n in fields[11:15]) / self.ticks
+                mem = self.memory(pid, fields)
+            except (OSError, IndexError, ValueError):
+                if pid == self.pid:
+                    raise
+                continue
+            if pid == self.pid:
+                server_cpu, server_rss = used, mem
+            cpu += used
+            rss += mem
+        return time.perf_counter(), cpu, rss, server_cpu, server_rss, len(pids)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.samples.append(self.read())
+            except OSError:
+                return
+
+    def summary(self):
+        if len(self.samples) < 2:
+            return None
+
+        def usage(column):
+            # A descendant exiting before its parent reaps it can make the total dip briefly
+            return [max(0.0, (b[column] - a[column]) / (b[0] - a[0]) * 100)
+                    for a, b in zip(self.samples, self.samples[1:])]
+
+        tree, server = usage(1), usage(3)
+        return {
+            'cpu_avg_percent': round(statistics.mean(tree), 1),
+            'cpu_peak_percent': round(max(tree), 1),
+            'rss_start_mb': round(self.samples[0][2], 1),
+            'rss_peak_mb': round(max(s[2] for s in self.samples), 1),
+            'rss_end_mb': round(self.samples[-1][2], 1),
+            'server_cpu_avg_percent': round(statistics.mean(server), 1),
+            'server_rss_peak_mb': round(max(s[4] for s in self.samples), 1),
+            'processes_peak': max(s[5] for s in self.samples),
+        }
+
+
+class Client(threading.Thread):
+    """One simulated user repeating a single kind of request until the deadline"""
+
+    def __init__(self, kind, target, corpus, files, work_dir, options, deadline, results, seed):
+        super().__init__(daemon=True)
+        self.kind = kind
+        self.host, self.port = target
+        self.corpus = corpus
+        self.files = files
+        self.work_dir = work_dir
+        self.options = options
+        self.deadline = deadline
+        self.results = results
+        self.rng = random.Random(seed)
+        self.etags = {}
+
+    def request(self, method, path, body=None, headers=None):
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=120)
+        headers = dict(headers or {})
+        if body is not None:
+            body = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        conn.request(method, path, body=body, headers=headers)
+        return conn, conn.getresponse()
+
+    def scan(self):
+        conn, response = self.request('POST', '/scan', {'directory': self.corpus, 'validate': self.options['validate']})
+        ok = response.status == 200 and json.loads(response.read()).get('success')
+        conn.close()
+        return ok
+
+    def browse(self):
+        conn, response = self.request('POST', '/browse', {'path': os.path.dirname(self.corpus)})
+        ok = response.status == 200 and json.loads(response.read()).get('success')
+        conn.close()
+        return ok
+
+    def image(self):
+        # Revisit some previews with their ETag, as a browser re-scanning would
+        name = self.rng.choice(self.files)
+        headers = {}
+        if name in self.etags and self.rng.random() < self.options['revalidate']:
+            headers['If-None-Match'] = self.etags[name]
+        conn, response = self.request('GET', '/image?' + urlencode({'dir': self.corpus, 'file': name}),
+                                      headers=headers)
+        response.read()
+        conn.close()
+        if response.getheader('ETag'):
+            self.etags[name] = response.getheader('ETag')
+        return response.status in (200, 304)
+
+    def process(self):
+        # /process consumes its inputs, so every job gets a fresh linked copy
+        job_dir = tempfile.mkdtemp(dir=self.work_dir)
+        batch = self.rng.sample(self.files, min(self.options['batch'], len(self.files)))
+        for name in batch:
+            try:
+                os.link(os.path.join(self.corpus, name), os.path.join(job_dir, name))
+            except OSError:
+                shutil.copyfile(os.path.join(self.corpus, name), os.path.join(job_dir, name))
+        payload = {'directory': job_dir, 'files': batch, 'prefix': 'load',
+                   'resize_size': self.options['resize'], 'crop_mode': self.options['crop']}
+        started = time.perf_counter()
+        conn, response = self.request('POST', '/process', payload)
+        first_event = None
+        ok = response.status == 200
+        complete = False
+        for raw in response:
+            line = raw.decode('utf-8').strip()
+            if not line.startswith('data: '):
+                continue
+            received = time.time()
+            if first_event is None:
+                first_event = time.perf_counter() - started
+            event = json.loads(line[6:])
+            if 'time' in event:
+                self.results.record_lag(received - event['time'])
+            if 'error' in event:
+                ok = False
+            complete = complete or bool(event.get('complete'))
+        conn.close()
+        shutil.rmtree(job_dir, ignore_errors=True)
+        if first_event is not None:
+            self.results.record('process:first-event', first_event, True)
+        return ok and complete
+
+    def run(self):
+        action = getattr(self, self.kind)
+        while time.time() < self.deadline:
+            started = time.perf_counter()
+            try:
+                ok = action()
+            except Exception:
+                ok = False
+            self.results.record(self.kind, time.perf_counter() - started, ok)
+
+
+class Results:
+    """Thread-safe latency, error and SSE lag accumulator"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.lags = []
+
+    def record(self, kind, seconds, ok):
+        with self.lock:
+            self.latencies.setdefault(kind, []).append(seconds)
+            self.errors[kind] = self.errors.get(kind, 0) + (not ok)
+
+    def record_lag(self, seconds):
+        with self.lock:
+            self.lags.append(max(0.0, seconds))
+
+    def summary(self, duration):
+        def percentiles(values):
+            ordered = sorted(values)
+            pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+            return {'p50_ms': round(pick(0.5) * 1000, 1), 'p90_ms': round(pick(0.9) * 1000, 1),
+                    'p99_ms': round(pick(0.99) * 1000, 1), 'max_ms': round(ordered[-1] * 1000, 1)}
+
+        endpoints = {}
+        for kind, values in sorted(self.latencies.items()):
+            endpoints[kind] = {
+                'requests': len(values),
+                'per_sec': round(len(values) / duration, 2),
+                'error_rate': round(self.errors[kind] / len(values), 4),
+                **percentiles(values),
+            }
+        return {'endpoints': endpoints, 'sse_lag': percentiles(self.lags) if self.lags else None}
+
+
+def parse_mix(spec):
+    """'image=16,process=2' -> {'image': 16, 'process': 2}"""
+    mix = {}
+    for item in spec.split(','):
+        kind, _, count = item.partition('=')
+        if kind not in KINDS or not count.isdigit():
+            raise ValueError(f'bad mix entry: {item!r} (expected one of {", ".join(KINDS)}=N)')
+        mix[kind] = int(count)
+    return mix
+
+
+def print_report(summary, server, mix, duration):
+    print(f"--- Load test ({', '.join(f'{k}={n}' for k, n in mix.items())} clients, {duration:.0f} s) ---")
+    print(f"{'endpoint':22s} {'reqs':>7s} {'req/s':>8s} {'errors':>7s} {'p50':>9s} {'p90':>9s} {'p99':>9s} {'max':>9s}")
+    for kind, s in summary['endpoints'].items():
+        print(f"{kind:22s} {s['requests']:7d} {s['per_sec']:8.2f} {s['error_rate'] * 100:6.1f}% "
+              f"{s['p50_ms']:7.1f}ms {s['p90_ms']:7.1f}ms {s['p99_ms']:7.1f}ms {s['max_ms']:7.1f}ms")
+    lag = summary['sse_lag']
+    if lag:
+        print(f"{'SSE event lag':22s} {'':7s} {'':8s} {'':7s} {lag['p50_ms']:7.1f}ms {lag['p90_ms']:7.1f}ms "
+              f"{lag['p99_ms']:7.1f}ms {lag['max_ms']:7.1f}ms")
+    if server:
+        print(f"server + workers CPU: {server['cpu_avg_percent']}% average, {server['cpu_peak_percent']}% peak; "
+              f"memory: {server['rss_start_mb']} -> {server['rss_peak_mb']} MB peak, {server['rss_end_mb']} MB at end "
+              f"({server['processes_peak']} processes at most)")
+        print(f"server process alone: {server['server_cpu_avg_percent']}% CPU average, "
+              f"{server['server_rss_peak_mb']} MB peak")
+    else:
+        print('server CPU/RSS: not sampled (needs /proc and a local server or --pid)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='MagicRenamer load test')
+    parser.add_argument('--mix', default='scan=2,browse=2,image=16,process=2',
+                        help='concurrent clients per endpoint, e.g. image=16,process=2')
+    parser.add_argument('--duration', type=float, default=30, help='seconds to run')
+    parser.add_argument('--images', type=int, default=200, help='corpus size')
+    parser.add_argument('--size', default='1024x768', help='corpus image size WxH')
+    parser.add_argument('--batch', type=int, default=5, help='images per /process job')
+    parser.add_argument('--resize', default='256', help='resize_size of /process jobs ("" for none)')
+    parser.add_argument('--crop', default='center', choices=['center', 'smart'])
+    parser.add_argument('--revalidate', type=float, default=0.5,
+                        help='fraction of repeat /image requests sent with If-None-Match')
+    parser.add_argument('--validate', action='store_true', help='run /scan with the integrity pass')
+    parser.add_argument('--url', help='test a running server instead of starting one')
+    parser.add_argument('--pid', type=int, help='PID of the --url server, for CPU/RSS sampling')
+    parser.add_argument('--json', metavar='PATH', help='also write the results as JSON')
+    args = parser.parse_args()
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+    width, _, height = args.size.partition('x')
+
+    with tempfile.TemporaryDirectory() as root:
+        corpus = os.path.join(root, 'corpus')
+        work_dir = os.path.join(root, 'jobs')
+        os.makedirs(work_dir)
+        print(f'Generating {args.images} images of {args.size}...')
+        files = make_corpus(corpus, args.images, (int(width), int(height)))
+
+        server = None
+        if args.url:
+            parts = urlsplit(args.url)
+            target = (parts.hostname, parts.port or 80)
+            pid = args.pid
+        else:
+            port = free_port()
+            server = start_server(port, root)
+            target = ('127.0.0.1', port)
+            pid = server.pid
+
+        sampler = ProcessSampler(pid) if pid and os.path.exists(f'/proc/{pid}') else None
+        if sampler:
+            sampler.start()
+        results = Results()
+        options = {'batch': args.batch, 'resize': args.resize, 'crop': args.crop,
+                   'revalidate': args.revalidate, 'validate': args.validate}
+        started = time.time()
+        deadline = started + args.duration
+        clients = [Client(kind, target, corpus, files, work_dir, options, deadline, results, seed=i * 100 + n)
+                   for i, (kind, count) in enumerate(mix.items()) for n in range(count)]
+        try:
+            for client in clients:
+                client.start()
+            for client in clients:
+                client.join()
+        finally:
+            if sampler:
+                sampler.stopped.set()
+                sampler.join()
+            if server:
+                server.terminate()
+                server.wait(10)
+
+        duration = time.time() - started
+        summary = results.summary(duration)
+        summary['server'] = sampler.summary() if sampler else None
+        print_report(summary, summary['server'], mix, duration)
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump({'mix': mix, 'duration': duration, **summary}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
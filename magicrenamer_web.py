@@ -3,16 +3,78 @@
 MagicRenamer Web Interface
 """
 
-from flask import Flask, render_template_string, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, send_from_directory, abort
 import os
+import gzip
+import hashlib
+import io
+import itertools
 import subprocess
+import tempfile
 from pathlib import Path
 import json
-from PIL import Image
-import smartcrop
+import math
+import mmap
+import multiprocessing
+import queue
+import re
+import shutil
+import signal
+import sqlite3
+import tarfile
+import threading
+import time
+import uuid
+import zipfile
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
 
-app = Flask(__name__)
+# PIL and smartcrop are imported where they are used so that starting the
+# server (and browsing/scanning) does not pay for them up front
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Static assets are served from memory by serve_asset(), not Flask's static route
+app = Flask(__name__, static_folder=None)
 VERSION = "2.1.2-web"
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+STARTED_AT = time.time()
+
+# Aspect-ratio bucketing: bucket sides are multiples of this step and the
+# extreme buckets are capped at this aspect ratio
+BUCKET_STEP = 64
+BUCKET_MAX_ASPECT = 4.0
+
+# Concurrent conversions per job and the memory budget every job on the server
+# shares. A task is admitted only while the estimated peak memory of everything
+# in flight stays under the budget; a single task larger than the whole budget
+# still runs, but alone. Requests may ask for less, never for more.
+CONVERT_WORKERS = int(os.environ.get('MAGICRENAMER_WORKERS', min(4, os.cpu_count() or 1)))
+MEMORY_BUDGET_MB = int(os.environ.get('MAGICRENAMER_MEMORY_MB', 2048))
+
+# Conversions run in supervised worker processes. One still running after its
+# deadline (this many seconds plus one per source megapixel) is killed along
+# with any magick it started, and its worker replaced. Workers are also
+# recycled after this many tasks or once their resident memory passes the
+# ceiling, so long sessions don't accumulate fragmented heap.
+TASK_TIMEOUT_SECONDS = float(os.environ.get('MAGICRENAMER_TASK_TIMEOUT', 120))
+WORKER_MAX_TASKS = int(os.environ.get('MAGICRENAMER_WORKER_MAX_TASKS', 200))
+WORKER_MAX_RSS_MB = int(os.environ.get('MAGICRENAMER_WORKER_MAX_RSS_MB', 1024))
+
+# Persistent smart-crop box cache (SQLite), bounded to this many entries;
+# least recently used boxes are evicted first, manual overrides never are
+CROP_CACHE_PATH = os.environ.get(
+    'MAGICRENAMER_CROP_CACHE',
+    os.path.join(os.path.expanduser('~'), '.cache', 'magicrenamer', 'crops.sqlite3'))
+CROP_CACHE_MAX_ENTRIES = int(os.environ.get('MAGICRENAMER_CROP_CACHE_ENTRIES', 200000))
+
+# /upload holds at most one encoded image per worker in memory, each capped
+# at this size; finished jobs' progress stays readable for this many seconds
+UPLOAD_MAX_IMAGE_MB = int(os.environ.get('MAGICRENAMER_UPLOAD_MAX_MB', 256))
+JOB_RETENTION_SECONDS = 300
 
 HTML_TEMPLATE = """
 <!DOCTYPE html>
@@ -20,454 +82,11 @@ HTML_TEMPLATE = """
 <head>
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <meta http-equiv="Cache-Control" content="no-cache, no-store, must-revalidate">
-    <meta http-equiv="Pragma" content="no-cache">
-    <meta http-equiv="Expires" content="0">
     <title>magic renamer v{{ version }}</title>
     <link rel="preconnect" href="https://fonts.googleapis.com">
     <link rel="preconnect" href="https://fonts.gstatic.com" crossorigin>
     <link href="https://fonts.googleapis.com/css2?family=Inter:wght@400;600;700;800&display=swap" rel="stylesheet">
-    <style>
-        * { margin: 0; padding: 0; box-sizing: border-box; }
-        body {
-            font-family: 'Inter', -apple-system, BlinkMacSystemFont, sans-serif;
-            background: #FFFEF9;
-            min-height: 100vh;
-            padding: 40px 20px;
-        }
-        .container {
-            max-width: 920px;
-            margin: 0 auto;
-        }
-        .header {
-            background: white;
-            border: 3px solid black;
-            border-radius: 24px;
-            padding: 40px;
-            text-align: center;
-            box-shadow: 6px 6px 0px 0px rgba(0,0,0,1);
-            margin-bottom: 30px;
-        }
-        .header h1 { 
-            font-size: 3em; 
-            font-weight: 800;
-            margin-bottom: 8px;
-            text-transform: lowercase;
-            letter-spacing: -1px;
-        }
-        .header p { 
-            color: #666;
-            font-weight: 600;
-            font-size: 0.9em;
-        }
-        .github-link {
-            position: fixed;
-            top: 16px;
-            right: 16px;
-            display: inline-flex;
-            align-items: center;
-            gap: 8px;
-            margin-top: 16px;
-            padding: 10px 20px;
-            background: white;
-            border: 2px solid black;
-            border-radius: 12px;
-            text-decoration: none;
-            color: black;
-            font-weight: 600;
-            font-size: 0.9em;
-            box-shadow: 3px 3px 0px 0px rgba(0,0,0,1);
-            transition: all 0.15s ease;
-        }
-        .github-link:hover {
-            background: #FCD34D;
-            transform: translate(2px, 2px);
-            box-shadow: none;
-        }
-        .card {
-            background: white;
-            border: 3px solid black;
-            border-radius: 20px;
-            padding: 30px;
-            box-shadow: 6px 6px 0px 0px rgba(0,0,0,1);
-            margin-bottom: 20px;
-        }
-        .form-group {
-            margin-bottom: 24px;
-        }
-        label {
-            display: block;
-            font-weight: 700;
-            margin-bottom: 10px;
-            color: black;
-            font-size: 0.95em;
-        }
-        .label-hint {
-            color: #999;
-            font-weight: 400;
-            font-size: 0.9em;
-        }
-        input[type="text"], select {
-            width: 100%;
-            padding: 14px 18px;
-            border: 3px solid black;
-            border-radius: 16px;
-            font-size: 15px;
-            font-family: 'Inter', sans-serif;
-            font-weight: 500;
-            background: white;
-            transition: all 0.15s ease;
-        }
-        input[type="text"]:focus, select:focus {
-            outline: none;
-            box-shadow: 4px 4px 0px 0px rgba(0,0,0,1);
-            transform: translate(-2px, -2px);
-        }
-        select {
-            cursor: pointer;
-        }
-        .input-with-button {
-            display: flex;
-            gap: 12px;
-            align-items: stretch;
-        }
-        .input-with-button input {
-            flex: 1;
-        }
-        .input-with-button .btn {
-            white-space: nowrap;
-            padding: 14px 24px;
-        }
-        .checkbox-wrapper {
-            background: #FCD34D;
-            border: 3px solid black;
-            border-radius: 16px;
-            padding: 16px 20px;
-            display: inline-flex;
-            align-items: center;
-            cursor: pointer;
-            box-shadow: 4px 4px 0px 0px rgba(0,0,0,1);
-            transition: all 0.15s ease;
-        }
-        .checkbox-wrapper:hover {
-            transform: translate(2px, 2px);
-            box-shadow: none;
-        }
-        .checkbox-wrapper input {
-            margin-right: 12px;
-            width: 22px;
-            height: 22px;
-            cursor: pointer;
-            accent-color: black;
-        }
-        .checkbox-wrapper label {
-            margin: 0;
-            cursor: pointer;
-            font-weight: 600;
-        }
-        .file-list-container {
-            background: white;
-            border: 3px solid black;
-            border-radius: 20px;
-            padding: 20px;
-            box-shadow: 4px 4px 0px 0px rgba(0,0,0,1);
-            position: relative;
-        }
-        .file-list {
-            display: grid;
-            grid-template-columns: repeat(auto-fill, minmax(120px, 1fr));
-            gap: 16px;
-            max-height: 500px;
-            overflow-y: auto;
-            padding: 4px;
-        }
-        .file-list.empty {
-            display: block;
-        }
-        .file-list::-webkit-scrollbar {
-            width: 10px;
-        }
-        .file-list::-webkit-scrollbar-track {
-            background: #f1f1f1;
-            border-radius: 10px;
-        }
-        .file-list::-webkit-scrollbar-thumb {
-            background: black;
-            border-radius: 10px;
-        }
-        .file-item {
-            background: #FFFEF9;
-            border: 2px solid black;
-            border-radius: 12px;
-            overflow: hidden;
-            transition: all 0.15s ease;
-            cursor: pointer;
-            position: relative;
-        }
-        .file-item:hover {
-            background: #FCD34D;
-            transform: translate(-2px, -2px);
-            box-shadow: 3px 3px 0px 0px rgba(0,0,0,1);
-        }
-        .file-item.selected {
-            border-color: #FCD34D;
-            border-width: 3px;
-        }
-        .file-item-image {
-            width: 100%;
-            height: 100px;
-            object-fit: cover;
-            display: block;
-            background: #e0e0e0;
-        }
-        .file-item-name {
-            padding: 8px;
-            font-weight: 500;
-            font-size: 0.75em;
-            text-align: center;
-            word-break: break-word;
-            line-height: 1.2;
-        }
-        .file-item-checkbox {
-            position: absolute;
-            top: 8px;
-            left: 8px;
-            width: 24px;
-            height: 24px;
-            cursor: pointer;
-            accent-color: black;
-            z-index: 10;
-        }
-        .selection-controls {
-            display: flex;
-            gap: 12px;
-            margin-bottom: 16px;
-            align-items: center;
-            flex-wrap: wrap;
-        }
-        .btn {
-            padding: 14px 28px;
-            border: 3px solid black;
-            border-radius: 16px;
-            font-size: 15px;
-            font-weight: 700;
-            cursor: pointer;
-            transition: all 0.15s ease;
-            font-family: 'Inter', sans-serif;
-            box-shadow: 4px 4px 0px 0px rgba(0,0,0,1);
-            background: white;
-            color: black;
-        }
-        .btn:hover:not(:disabled) {
-            transform: translate(2px, 2px);
-            box-shadow: none;
-        }
-        .btn-primary {
-            background: #FCD34D;
-            color: black;
-        }
-        .btn-small {
-            padding: 10px 20px;
-            font-size: 14px;
-        }
-        .btn:disabled {
-            opacity: 0.4;
-            cursor: not-allowed;
-        }
-        .button-group {
-            display: flex;
-            gap: 12px;
-            margin-top: 24px;
-            flex-wrap: wrap;
-        }
-        .status {
-            padding: 20px 24px;
-            border-radius: 16px;
-            margin-top: 20px;
-            display: none;
-            border: 3px solid black;
-            font-weight: 600;
-            box-shadow: 4px 4px 0px 0px rgba(0,0,0,1);
-        }
-        .status.success { background: #86efac; color: black; }
-        .status.error { background: #fca5a5; color: black; }
-        .status.info { background: #93c5fd; color: black; }
-        .log-window {
-            background: black;
-            color: #00ff00;
-            padding: 20px;
-            border-radius: 16px;
-            max-height: 320px;
-            overflow-y: auto;
-            font-family: 'Courier New', monospace;
-            font-size: 13px;
-            margin-top: 20px;
-            display: none;
-            border: 3px solid black;
-            box-shadow: 4px 4px 0px 0px rgba(0,0,0,1);
-        }
-        .log-window::-webkit-scrollbar {
-            width: 10px;
-        }
-        .log-window::-webkit-scrollbar-track {
-            background: #222;
-        }
-        .log-window::-webkit-scrollbar-thumb {
-            background: #00ff00;
-            border-radius: 5px;
-        }
-        .log-line { margin: 3px 0; }
-        .log-success { color: #00ff00; }
-        .log-error { color: #ff4444; }
-        .log-info { color: #00d4ff; }
-        .selection-count {
-            background: white;
-            border: 2px solid black;
-            border-radius: 12px;
-            padding: 8px 16px;
-            font-weight: 700;
-            font-size: 14px;
-            margin-left: auto;
-        }
-        .empty-state {
-            text-align: center;
-            padding: 60px 20px;
-            color: #999;
-            font-weight: 600;
-            font-size: 1.1em;
-        }
-        .section-title {
-            font-weight: 700;
-            font-size: 1.1em;
-            margin-bottom: 16px;
-            text-transform: lowercase;
-        }
-        .modal {
-            display: none;
-            position: fixed;
-            top: 0;
-            left: 0;
-            width: 100%;
-            height: 100%;
-            background: rgba(0, 0, 0, 0.5);
-            z-index: 1000;
-            align-items: center;
-            justify-content: center;
-        }
-        .modal.active {
-            display: flex;
-        }
-        .modal-content {
-            background: white;
-            border: 3px solid black;
-            border-radius: 20px;
-            padding: 30px;
-            max-width: 600px;
-            width: 90%;
-            max-height: 80vh;
-            overflow-y: auto;
-            box-shadow: 8px 8px 0px 0px rgba(0,0,0,1);
-        }
-        .modal-header {
-            font-weight: 700;
-            font-size: 1.3em;
-            margin-bottom: 20px;
-            text-transform: lowercase;
-        }
-        .modal-close {
-            float: right;
-            font-size: 1.5em;
-            cursor: pointer;
-            font-weight: 700;
-            line-height: 1;
-        }
-        .dir-item {
-            padding: 12px 16px;
-            margin: 6px 0;
-            background: #FFFEF9;
-            border: 2px solid black;
-            border-radius: 12px;
-            cursor: pointer;
-            transition: all 0.15s ease;
-            font-weight: 500;
-        }
-        .dir-item:hover {
-            background: #FCD34D;
-            transform: translate(-1px, -1px);
-            box-shadow: 2px 2px 0px 0px rgba(0,0,0,1);
-        }
-        .dir-item.parent {
-            background: #93c5fd;
-        }
-        .breadcrumb {
-            background: white;
-            border: 2px solid black;
-            border-radius: 12px;
-            padding: 12px 16px;
-            margin-bottom: 16px;
-            font-weight: 600;
-            word-break: break-all;
-        }
-        .progress-bar {
-            background: white;
-            border: 3px solid black;
-            border-radius: 16px;
-            padding: 20px;
-            margin-top: 20px;
-            display: none;
-            box-shadow: 4px 4px 0px 0px rgba(0,0,0,1);
-        }
-        .progress-bar-inner {
-            background: #e0e0e0;
-            border: 2px solid black;
-            border-radius: 10px;
-            height: 40px;
-            overflow: hidden;
-            position: relative;
-        }
-        .progress-bar-fill {
-            background: linear-gradient(90deg, #FCD34D 0%, #FCA5A5 100%);
-            height: 100%;
-            width: 0%;
-            transition: width 0.3s ease;
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            font-weight: 700;
-            color: black;
-        }
-        .progress-text {
-            text-align: center;
-            margin-top: 12px;
-            font-weight: 600;
-            font-size: 14px;
-        }
-        .resize-options {
-            display: grid;
-            grid-template-columns: repeat(auto-fit, minmax(120px, 1fr));
-            gap: 12px;
-        }
-        .resize-option {
-            background: white;
-            border: 3px solid #ddd;
-            border-radius: 12px;
-            padding: 16px;
-            text-align: center;
-            cursor: pointer;
-            transition: all 0.15s ease;
-            font-weight: 600;
-        }
-        .resize-option:hover {
-            border-color: black;
-            transform: translate(-1px, -1px);
-            box-shadow: 2px 2px 0px 0px rgba(0,0,0,1);
-        }
-        .resize-option.selected {
-            background: #FCD34D;
-            border-color: black;
-            box-shadow: 3px 3px 0px 0px rgba(0,0,0,1);
-        }
-    </style>
+    <link rel="stylesheet" href="{{ asset_url('magicrenamer.css') }}">
 </head>
 <body>
     <div class="container">
@@ -493,6 +112,11 @@ HTML_TEMPLATE = """
                 <input type="text" id="prefix" placeholder="e.g., photo, image, etc.">
             </div>
             
+            <div class="form-group">
+                <label>output directory <span class="label-hint">(optional, keeps originals untouched)</span></label>
+                <input type="text" id="outputDir" placeholder="leave empty to rename in place">
+            </div>
+            
             <div class="form-group">
                 <label>resize for AI training <span class="label-hint">(optional)</span></label>
                 <div class="resize-options">
@@ -519,6 +143,13 @@ HTML_TEMPLATE = """
                 </div>
             </div>
             
+            <div class="form-group">
+                <div class="checkbox-wrapper">
+                    <input type="checkbox" id="aspectBuckets">
+                    <label for="aspectBuckets">aspect-ratio buckets <span class="label-hint">(keep portrait/landscape within the size's pixel budget)</span></label>
+                </div>
+            </div>
+            
             <div class="form-group">
                 <label>crop mode <span class="label-hint">(when resizing)</span></label>
                 <select id="cropMode">
@@ -527,6 +158,36 @@ HTML_TEMPLATE = """
                 </select>
             </div>
             
+            <div class="form-group">
+                <label>resize quality <span class="label-hint">(when resizing)</span></label>
+                <select id="quality">
+                    <option value="best">Best (single Lanczos pass, slowest)</option>
+                    <option value="balanced">Balanced (two-stage reduce + Lanczos)</option>
+                    <option value="fast">Fast (integer reduce + bilinear)</option>
+                </select>
+            </div>
+            
+            <div class="form-group">
+                <div class="checkbox-wrapper">
+                    <input type="checkbox" id="appendMode">
+                    <label for="appendMode">append <span class="label-hint">(continue after existing prefix-N.png files, leave them untouched)</span></label>
+                </div>
+            </div>
+            
+            <div class="form-group">
+                <div class="checkbox-wrapper">
+                    <input type="checkbox" id="validateFiles" checked>
+                    <label for="validateFiles">check files for corruption on scan <span class="label-hint">(broken files are flagged and left unselected)</span></label>
+                </div>
+            </div>
+            
+            <div class="form-group">
+                <div class="checkbox-wrapper">
+                    <input type="checkbox" id="prefilterFiles">
+                    <label for="prefilterFiles">skip unusable images on scan <span class="label-hint">(tiny, blank or heavily blurred images are flagged and left unselected)</span></label>
+                </div>
+            </div>
+            
             <div class="form-group">
                 <div class="checkbox-wrapper">
                     <input type="checkbox" id="skipConfirm">
@@ -551,6 +212,7 @@ HTML_TEMPLATE = """
         
         <div class="button-group">
             <button class="btn" onclick="scanDirectory()">🔍 scan directory</button>
+            <button class="btn" id="planButton" onclick="planImages()">🧮 dry run</button>
             <button class="btn btn-primary" onclick="processImages()">▶ process selected images</button>
         </div>
         
@@ -578,319 +240,116 @@ HTML_TEMPLATE = """
     </div>
 
     <script>
-        // MagicRenamer v2.1.2 - Cache busting fix - Timestamp: 2026-01-13-07:00
-        let imageFiles = [];
-        let currentBrowsePath = '{{ current_dir }}';
-        let selectedResizeSize = '';
-        
-        function selectResize(size) {
-            selectedResizeSize = size;
-            document.querySelectorAll('.resize-option').forEach(function(opt) {
-                if (opt.dataset.size === size) {
-                    opt.classList.add('selected');
-                } else {
-                    opt.classList.remove('selected');
-                }
-            });
-        }
-        
-        function openBrowser() {
-            currentBrowsePath = document.getElementById('directory').value || '{{ current_dir }}';
-            document.getElementById('dirModal').classList.add('active');
-            loadDirectories(currentBrowsePath);
-        }
-        
-        function closeBrowser() {
-            document.getElementById('dirModal').classList.remove('active');
-        }
-        
-        // Select "No resize" by default on page load
-        window.addEventListener('DOMContentLoaded', function() {
-            selectResize('');
-        });
-        
-        async function loadDirectories(path) {
-            try {
-                const response = await fetch('/browse', {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ path: path })
-                });
-                
-                const data = await response.json();
-                
-                if (data.success) {
-                    currentBrowsePath = data.current_path;
-                    document.getElementById('currentPath').textContent = data.current_path;
-                    
-                    const dirList = document.getElementById('dirList');
-                    dirList.innerHTML = '';
-                    
-                    // Add parent directory option
-                    if (data.parent) {
-                        const parentDiv = document.createElement('div');
-                        parentDiv.className = 'dir-item parent';
-                        parentDiv.textContent = '📁 .. (parent directory)';
-                        parentDiv.onclick = function() { loadDirectories(data.parent); };
-                        dirList.appendChild(parentDiv);
-                    }
-                    
-                    // Add "Select this directory" button
-                    const selectBtn = document.createElement('button');
-                    selectBtn.className = 'btn btn-primary';
-                    selectBtn.style.width = '100%';
-                    selectBtn.style.marginBottom = '16px';
-                    selectBtn.textContent = '✓ select this directory';
-                    selectBtn.onclick = function() {
-                        document.getElementById('directory').value = currentBrowsePath;
-                        closeBrowser();
-                        scanDirectory();
-                    };
-                    dirList.appendChild(selectBtn);
-                    
-                    // Add subdirectories
-                    data.directories.forEach(function(dir) {
-                        const dirDiv = document.createElement('div');
-                        dirDiv.className = 'dir-item';
-                        dirDiv.textContent = '📁 ' + dir;
-                        dirDiv.onclick = function() { loadDirectories(data.current_path + '/' + dir); };
-                        dirList.appendChild(dirDiv);
-                    });
-                    
-                    if (data.directories.length === 0 && !data.parent) {
-                        dirList.innerHTML += '<div class="empty-state">no subdirectories</div>';
-                    }
-                } else {
-                    alert('Error: ' + data.error);
-                }
-            } catch (error) {
-                alert('Error loading directories: ' + error.message);
-            }
-        }
-        
-        function showStatus(message, type) {
-            const status = document.getElementById('status');
-            status.textContent = message;
-            status.className = 'status ' + type;
-            status.style.display = 'block';
-        }
-        
-        function addLog(message, type) {
-            type = type || '';
-            const logWindow = document.getElementById('logWindow');
-            logWindow.style.display = 'block';
-            const line = document.createElement('div');
-            line.className = 'log-line log-' + type;
-            line.textContent = message;
-            logWindow.appendChild(line);
-            logWindow.scrollTop = logWindow.scrollHeight;
-        }
-        
-        function clearLog() {
-            document.getElementById('logWindow').innerHTML = '';
-            document.getElementById('logWindow').style.display = 'none';
-        }
-        
-        function updateProgress(current, total, message) {
-            const progressBar = document.getElementById('progressBar');
-            const progressFill = document.getElementById('progressFill');
-            const progressText = document.getElementById('progressText');
-            
-            progressBar.style.display = 'block';
-            const percentage = Math.round((current / total) * 100);
-            progressFill.style.width = percentage + '%';
-            progressFill.textContent = percentage + '%';
-            progressText.textContent = message || ('Processing ' + current + ' of ' + total + '...');
-        }
-        
-        function hideProgress() {
-            document.getElementById('progressBar').style.display = 'none';
-        }
-        
-        function updateSelectionCount() {
-            const checkboxes = document.querySelectorAll('.file-item input[type="checkbox"]');
-            const selected = Array.from(checkboxes).filter(function(cb) { return cb.checked; }).length;
-            document.getElementById('selectionCount').textContent = selected + ' of ' + checkboxes.length + ' selected';
-        }
-        
-        function selectAll() {
-            document.querySelectorAll('.file-item input[type="checkbox"]').forEach(function(cb) { cb.checked = true; });
-            updateSelectionCount();
-        }
-        
-        function deselectAll() {
-            document.querySelectorAll('.file-item input[type="checkbox"]').forEach(function(cb) { cb.checked = false; });
-            updateSelectionCount();
-        }
-        
-        async function scanDirectory() {
-            const directory = document.getElementById('directory').value;
-            showStatus('Scanning directory...', 'info');
-            
-            try {
-                const response = await fetch('/scan', {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ directory: directory })
-                });
-                
-                const data = await response.json();
-                
-                if (data.success) {
-                    imageFiles = data.files;
-                    renderFileList(data.files);
-                    showStatus('Found ' + data.files.length + ' images', 'success');
-                } else {
-                    showStatus(data.error, 'error');
-                }
-            } catch (error) {
-                showStatus('Error scanning directory: ' + error.message, 'error');
-            }
-        }
-        
-        function renderFileList(files) {
-            const fileList = document.getElementById('fileList');
-            
-            if (files.length === 0) {
-                fileList.innerHTML = '<div class="empty-state">No images found</div>';
-                fileList.classList.add('empty');
-                return;
-            }
-            
-            const directory = document.getElementById('directory').value;
-            fileList.classList.remove('empty');
-            
-            let html = '';
-            files.forEach(function(file, idx) {
-                html += '<div class="file-item" onclick="toggleFileSelection(' + idx + ')" id="file-' + idx + '">' +
-                    '<input type="checkbox" class="file-item-checkbox" checked onchange="updateSelectionCount()" onclick="event.stopPropagation()">' +
-                    '<img src="/image?dir=' + encodeURIComponent(directory) + '&file=' + encodeURIComponent(file) + '" class="file-item-image" alt="' + file + '">' +
-                    '<div class="file-item-name">' + file + '</div>' +
-                '</div>';
-            });
-            fileList.innerHTML = html;
-            
-            updateSelectionCount();
-        }
-        
-        function toggleFileSelection(idx) {
-            const checkbox = document.querySelectorAll('.file-item-checkbox')[idx];
-            checkbox.checked = !checkbox.checked;
-            updateSelectionCount();
-        }
-        
-        async function processImages() {
-            const directory = document.getElementById('directory').value;
-            const prefix = document.getElementById('prefix').value;
-            const resizeSize = selectedResizeSize;
-            const cropMode = document.getElementById('cropMode').value;
-            const skipConfirm = document.getElementById('skipConfirm').checked;
-            
-            const checkboxes = document.querySelectorAll('.file-item input[type="checkbox"]');
-            const selectedFiles = Array.from(checkboxes)
-                .map(function(cb, idx) { return cb.checked ? imageFiles[idx] : null; })
-                .filter(function(f) { return f !== null; });
-            
-            if (selectedFiles.length === 0) {
-                showStatus('No images selected', 'error');
-                return;
-            }
-            
-            if (!skipConfirm) {
-                const naming = prefix ? (prefix + '-1.png, ' + prefix + '-2.png, ...') : '1.png, 2.png, ...';
-                var msg = 'This will process ' + selectedFiles.length + ' selected images:';
-                msg += String.fromCharCode(10) + String.fromCharCode(10);
-                msg += '1. Convert to PNG format' + String.fromCharCode(10);
-                
-                if (resizeSize) {
-                    msg += '2. Resize to ' + resizeSize + 'x' + resizeSize + ' (' + cropMode + ' crop)' + String.fromCharCode(10);
-                    msg += '3. Delete original files' + String.fromCharCode(10);
-                    msg += '4. Rename sequentially: ' + naming + String.fromCharCode(10) + String.fromCharCode(10);
-                } else {
-                    msg += '2. Delete original files' + String.fromCharCode(10);
-                    msg += '3. Rename sequentially: ' + naming + String.fromCharCode(10) + String.fromCharCode(10);
-                }
-                
-                msg += 'WARNING: This action cannot be undone!' + String.fromCharCode(10) + String.fromCharCode(10) + 'Continue?';
-                
-                if (!confirm(msg)) return;
-            }
-            
-            clearLog();
-            hideProgress();
-            showStatus('Processing images...', 'info');
-            updateProgress(0, selectedFiles.length, 'Starting...');
-            
-            try {
-                const response = await fetch('/process', {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ 
-                        directory: directory, 
-                        prefix: prefix, 
-                        files: selectedFiles,
-                        resize_size: resizeSize,
-                        crop_mode: cropMode
-                    })
-                });
-                
-                const reader = response.body.getReader();
-                const decoder = new TextDecoder();
-                
-                while (true) {
-                    const result = await reader.read();
-                    if (result.done) break;
-                    
-                    const text = decoder.decode(result.value);
-                    const lines = text.split(String.fromCharCode(10)).filter(function(l) { return l.trim(); });
-                    
-                    for (let i = 0; i < lines.length; i++) {
-                        const line = lines[i];
-                        if (line.startsWith('data: ')) {
-                            const data = JSON.parse(line.substring(6));
-                            
-                            if (data.progress) {
-                                updateProgress(data.current, data.total, data.message);
-                            }
-                            
-                            if (data.log) {
-                                if (data.log.startsWith('✓')) addLog(data.log, 'success');
-                                else if (data.log.startsWith('✗')) addLog(data.log, 'error');
-                                else if (data.log.startsWith('---')) addLog(data.log, 'info');
-                                else addLog(data.log);
-                            }
-                            
-                            if (data.complete) {
-                                hideProgress();
-                                showStatus('✓ Successfully processed ' + data.processed + ' images!', 'success');
-                                await scanDirectory();
-                            }
-                            
-                            if (data.error) {
-                                hideProgress();
-                                showStatus('Error: ' + data.error, 'error');
-                            }
-                        }
-                    }
-                }
-            } catch (error) {
-                hideProgress();
-                showStatus('Error processing images: ' + error.message, 'error');
-            }
-        }
-        
-        // Auto-scan on load
-        window.onload = function() { scanDirectory(); };
+        window.MAGICRENAMER = { version: {{ version|tojson }}, currentDir: {{ current_dir|tojson }} };
     </script>
+    <script src="{{ asset_url('magicrenamer.js') }}"></script>
 </body>
 </html>
 """
 
+_capabilities = None
+_capabilities_lock = threading.Lock()
+
+def detect_capabilities():
+    """Probe external tools and Pillow codecs (slow: runs subprocesses and imports PIL)"""
+    caps = {
+        'magick': shutil.which('magick'),
+        'identify': shutil.which('identify'),
+        'magick_version': None,
+        'magick_delegates': [],
+    }
+    if caps['magick']:
+        try:
+            result = subprocess.run([caps['magick'], '-version'], capture_output=True, text=True, timeout=5)
+            for line in result.stdout.splitlines():
+                if line.startswith('Version:'):
+                    caps['magick_version'] = line.split(':', 1)[1].strip()
+                elif line.startswith('Delegates'):
+                    caps['magick_delegates'] = line.split(':', 1)[1].split()
+        except (subprocess.TimeoutExpired, OSError):
+            caps['magick'] = None
+    
+    from PIL import Image, features
+    import PIL
+    Image.init()
+    caps['pillow_version'] = PIL.__version__
+    caps['pillow_formats'] = sorted(Image.OPEN)
+    caps['pillow_codecs'] = {name: bool(features.check(name))
+                             for name in ('jpg', 'zlib', 'libtiff', 'webp', 'jpg_2000')}
+    try:
+        import smartcrop  # noqa: F401
+        caps['smartcrop'] = True
+    except ImportError:
+        caps['smartcrop'] = False
+    caps['brotli'] = brotli is not None
+    return caps
+
+def get_capabilities():
+    """Tool and codec capabilities, detected once and cached for the process lifetime"""
+    global _capabilities
+    if _capabilities is None:
+        with _capabilities_lock:
+            if _capabilities is None:
+                _capabilities = detect_capabilities()
+    return _capabilities
+
+def load_assets(static_dir):
+    """Read static assets once, fingerprint them and precompress each encoding"""
+    assets = {}
+    for name in sorted(os.listdir(static_dir)):
+        path = os.path.join(static_dir, name)
+        if not os.path.isfile(path):
+            continue
+        with open(path, 'rb') as f:
+            body = f.read()
+        encodings = {'gzip': gzip.compress(body, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            encodings['br'] = brotli.compress(body, quality=11)
+        assets[name] = {
+            'version': hashlib.sha256(body).hexdigest()[:12],
+            'mimetype': 'text/css' if name.endswith('.css') else 'application/javascript',
+            'identity': body,
+            'encodings': encodings,
+        }
+    return assets
+
+ASSETS = load_assets(STATIC_DIR)
+
+def asset_url(name):
+    """Versioned URL of a static asset; the version changes whenever its content does"""
+    return f"/assets/{ASSETS[name]['version']}/{name}"
+
+# Compiled once at import; each request only renders the small dynamic bootstrap
+PAGE_TEMPLATE = app.jinja_env.from_string(HTML_TEMPLATE)
+
 @app.route('/')
 def index():
-    return render_template_string(HTML_TEMPLATE, 
-                                 version=VERSION, 
-                                 current_dir=os.getcwd())
+    html = PAGE_TEMPLATE.render(version=VERSION, 
+                                current_dir=os.getcwd(),
+                                asset_url=asset_url)
+    # The page embeds the current directory, so it is always revalidated
+    return html, 200, {'Content-Type': 'text/html; charset=utf-8', 'Cache-Control': 'no-cache'}
+
+@app.route('/assets/<version>/<name>')
+def serve_asset(version, name):
+    """Serve a fingerprinted asset, precompressed when the client accepts it"""
+    asset = ASSETS.get(name)
+    if asset is None or asset['version'] != version:
+        abort(404)
+    
+    body, encoding = asset['identity'], None
+    for candidate in ('br', 'gzip'):
+        if candidate in asset['encodings'] and request.accept_encodings[candidate]:
+            body, encoding = asset['encodings'][candidate], candidate
+            break
+    
+    response = app.response_class(body, mimetype=asset['mimetype'])
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    response.set_etag(f"{version}-{encoding or 'identity'}")
+    return response.make_conditional(request)
 
 @app.route('/favicon.ico')
 def favicon():
@@ -902,31 +361,152 @@ def favicon():
     </svg>'''
     return svg, 200, {'Content-Type': 'image/svg+xml'}
 
+@app.route('/health')
+def health():
+    """Liveness plus cached tool/codec capabilities"""
+    caps = get_capabilities()
+    return jsonify({
+        'success': True,
+        'version': VERSION,
+        'uptime': round(time.time() - STARTED_AT, 1),
+        'ready': caps['magick'] is not None,
+        'capabilities': caps
+    })
+
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp', '.tiff', '.tif']
+
+def natural_sort_key(s):
+    """Natural sort (numeric sort for numbers in filenames)"""
+    return [int(text) if text.isdigit() else text.lower()
+            for text in re.split('([0-9]+)', s)]
+
+def list_images(directory):
+    """Supported image files in a directory, naturally sorted, excluding temp files"""
+    files = []
+    for file in os.listdir(directory):
+        if any(file.lower().endswith(ext) for ext in IMAGE_EXTENSIONS):
+            if not file.startswith('temp_'):
+                files.append(file)
+    files.sort(key=natural_sort_key)
+    return files
+
+ARCHIVE_EXTENSIONS = ('.zip', '.tar', '.tar.gz', '.tgz')
+
+def is_archive(path):
+    """True for a zip or tar(.gz) file, which can stand in for a directory"""
+    return path.lower().endswith(ARCHIVE_EXTENSIONS) and os.path.isfile(path)
+
+# Member index per archive, keyed by path, mtime and size like the probe cache
+_archive_index = {}
+_archive_lock = threading.Lock()
+
+class ArchiveSource:
+    """Read-only view of an archive's image members, decoded as streams without extraction"""
+    
+    def __init__(self, path):
+        self.path = path
+        self.zip = zipfile.ZipFile(path) if zipfile.is_zipfile(path) else None
+        self.tar = None if self.zip else tarfile.open(path)
+        
+        st = os.stat(path)
+        key = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+        with _archive_lock:
+            self.index = _archive_index.get(key)
+        if self.index is None:
+            if self.zip:
+                entries = [(i.filename, i) for i in self.zip.infolist() if not i.is_dir()]
+            else:
+                # tar has no central index: reading every header once (which for
+                # tar.gz inflates the whole stream) yields the member offsets
+                entries = [(m.name, m) for m in self.tar.getmembers() if m.isfile()]
+            self.index = {name: entry for name, entry in entries
+                          if name.lower().endswith(tuple(IMAGE_EXTENSIONS))
+                          and not os.path.basename(name).startswith('temp_')}
+            with _archive_lock:
+                _archive_index[key] = self.index
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        (self.zip or self.tar).close()
+    
+    def names(self):
+        """Image members, naturally sorted, excluding temp files"""
+        return sorted(self.index, key=natural_sort_key)
+    
+    def open(self, member):
+        entry = self.index[member]
+        return self.zip.open(entry) if self.zip else self.tar.extractfile(entry)
+    
+    def read(self, member):
+        with self.open(member) as f:
+            return f.read()
+    
+    def ordered(self, members):
+        """Known members in the cheapest reading order"""
+        members = [m for m in members if m in self.index]
+        if self.tar:
+            # Archive order: seeking backwards in a tar.gz re-inflates from the start
+            members.sort(key=lambda m: self.index[m].offset)
+        return members
+    
+    def probe(self, members):
+        """{member: info} from member headers only, like probe_files"""
+        from PIL import Image
+        
+        info = {}
+        for member in self.ordered(members):
+            try:
+                with self.open(member) as f, Image.open(f) as img:
+                    info[member] = header_info(img)
+            except Exception:
+                pass
+        return info
+    
+    def iter_members(self, members):
+        """Yield (member, data) for the given members, one at a time"""
+        for member in self.ordered(members):
+            yield member, self.read(member)
+
 @app.route('/scan', methods=['POST'])
 def scan_directory():
     data = request.json
     directory = data.get('directory', os.getcwd())
     
+    if is_archive(directory):
+        try:
+            with ArchiveSource(directory) as archive:
+                files = archive.names()
+                probed = archive.probe(files) if data.get('probe', True) else {}
+            info = {name: {'width': i['width'], 'height': i['height'],
+                           'format': i['format'], 'frames': i['frames']}
+                    for name, i in probed.items()}
+            return jsonify({'success': True, 'files': files, 'info': info, 'problems': {}, 'rejected': {},
+                            'archive': True})
+        except Exception as e:
+            return jsonify({'success': False, 'error': f'Unreadable archive: {e}'})
+    
     if not os.path.isdir(directory):
         return jsonify({'success': False, 'error': 'Invalid directory path'})
     
-    extensions = ['.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp', '.tiff', '.tif']
-    
     try:
-        files = []
-        for file in os.listdir(directory):
-            if any(file.lower().endswith(ext) for ext in extensions):
-                if not file.startswith('temp_'):
-                    files.append(file)
+        files = list_images(directory)
         
-        # Natural sort (numeric sort for numbers in filenames)
-        import re
-        def natural_sort_key(s):
-            return [int(text) if text.isdigit() else text.lower()
-                    for text in re.split('([0-9]+)', s)]
+        # Header probes (cached by mtime/size) expose dimensions and frame counts
+        info = {}
+        if data.get('probe', True):
+            probed = probe_files(directory, files)
+            info = {name: {'width': i['width'], 'height': i['height'],
+                           'format': i['format'], 'frames': i['frames']}
+                    for name, i in probed.items()}
         
-        files.sort(key=natural_sort_key)
-        return jsonify({'success': True, 'files': files})
+        # Optional integrity pass: signatures, header sanity and end markers
+        problems = validate_files(directory, files) if data.get('validate') else {}
+        # Optional quality prefilter: tiny, blank and heavily blurred images
+        thresholds = prefilter_thresholds(data.get('prefilter'))
+        rejected = prefilter_files(directory, files, data.get('resize_size'), thresholds) if thresholds else {}
+        return jsonify({'success': True, 'files': files, 'info': info, 'problems': problems, 'rejected': rejected})
     except PermissionError:
         return jsonify({'success': False, 'error': 'Permission denied'})
     except Exception as e:
@@ -944,13 +524,18 @@ def browse_directory():
         if not os.path.isdir(path):
             return jsonify({'success': False, 'error': 'Invalid directory path'})
         
-        # Get subdirectories only
+        # Get subdirectories, plus archives that can be used as a source
         directories = []
+        archives = []
         try:
             for item in sorted(os.listdir(path)):
                 item_path = os.path.join(path, item)
-                if os.path.isdir(item_path) and not item.startswith('.'):
+                if item.startswith('.'):
+                    continue
+                if os.path.isdir(item_path):
                     directories.append(item)
+                elif is_archive(item_path):
+                    archives.append(item)
         except PermissionError:
             pass
         
@@ -961,7 +546,8 @@ def browse_directory():
             'success': True,
             'current_path': path,
             'parent': parent,
-            'directories': directories
+            'directories': directories,
+            'archives': archives
         })
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
@@ -978,106 +564,1611 @@ def serve_image():
         
         # Normalize the directory path
         directory = os.path.abspath(os.path.expanduser(directory))
+        if is_archive(directory):
+            return serve_archive_member(directory, filename)
         
         # Security check - ensure the file exists and is in the specified directory
         file_path = os.path.join(directory, filename)
         if not os.path.exists(file_path) or not os.path.isfile(file_path):
             return '', 404
         
-        return send_from_directory(directory, filename)
+        # Strong validator from inode, mtime and size: a file replaced under the
+        # same name (e.g. 1.png after a re-run) always gets a new ETag
+        st = os.stat(file_path)
+        etag = f'{st.st_ino:x}-{st.st_mtime_ns:x}-{st.st_size:x}'
+        
+        # conditional=True answers If-None-Match / If-Modified-Since with 304
+        # and serves Range requests as 206
+        response = send_from_directory(directory, filename, conditional=True,
+                                       etag=etag, last_modified=st.st_mtime)
+        # Previews may be cached but must be revalidated, since file names are reused
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response
     except Exception as e:
         return '', 404
 
-def resize_center_crop(input_file, output_file, target_size):
-    """Resize and center crop image"""
-    try:
-        # Get dimensions
-        result = subprocess.run(
-            ['identify', '-format', '%wx%h', input_file],
-            capture_output=True, text=True, timeout=5
-        )
-        if result.returncode != 0:
-            return False
-        
-        dims = result.stdout.strip().split('x')
-        width, height = int(dims[0]), int(dims[1])
-        
-        # Calculate crop dimensions
-        if width > height:
-            # Wider - crop width
-            new_width = height
-            offset_x = (width - new_width) // 2
-            crop_geometry = f"{new_width}x{height}+{offset_x}+0"
-        else:
-            # Taller - crop height
-            new_height = width
-            offset_y = (height - new_height) // 2
-            crop_geometry = f"{width}x{new_height}+0+{offset_y}"
-        
-        # Crop and resize
-        result = subprocess.run(
-            ['magick', input_file, '-crop', crop_geometry, '-resize', 
-             f'{target_size}x{target_size}', output_file],
-            capture_output=True, timeout=30
-        )
-        
-        return result.returncode == 0
-    except Exception:
-        return False
+def serve_archive_member(path, member):
+    """Preview of one archive member, revalidated against the archive's identity"""
+    import mimetypes
+    
+    st = os.stat(path)
+    etag = hashlib.blake2b(f'{st.st_ino}-{st.st_mtime_ns}-{st.st_size}/{member}'.encode(), digest_size=12).hexdigest()
+    with ArchiveSource(path) as archive:
+        if member not in archive.index:
+            return '', 404
+        response = app.response_class(mimetype=mimetypes.guess_type(member)[0] or 'application/octet-stream')
+        response.set_etag(etag)
+        response.last_modified = st.st_mtime
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        if request.if_none_match.contains(etag):
+            response.status_code = 304
+            return response
+        response.set_data(archive.read(member))
+    return response
 
-def resize_smart_crop(input_file, output_file, target_size):
-    """Resize with AI-based smart cropping using attention detection"""
+_probe_cache = {}
+_probe_lock = threading.Lock()
+
+def header_info(img):
+    """Probe fields of a lazily opened Pillow image"""
+    # n_frames walks frame headers (GIF blocks, TIFF IFDs) without decoding them
+    return {
+        'width': img.width,
+        'height': img.height,
+        'format': img.format,
+        'mode': img.mode,
+        'frames': getattr(img, 'n_frames', 1),
+    }
+
+def ping_image(path, data=None):
+    """probe_image through ImageMagick's header-only ping (of data on stdin when given)"""
+    result = subprocess.run(
+        ['identify', '-ping', '-format', '%w %h %m %n\n', '-' if data is not None else path],
+        input=data, capture_output=True, timeout=30
+    )
+    if result.returncode != 0 or not result.stdout.strip():
+        raise ValueError(result.stderr.decode(errors='replace').strip() or 'unreadable header')
+    # One line per frame, each carrying the total frame count
+    width, height, fmt, frames = result.stdout.decode().split('\n')[0].split()
+    return {'width': int(width), 'height': int(height), 'format': fmt, 'mode': 'RGB', 'frames': int(frames)}
+
+def probe_image(path):
+    """Read image dimensions and format from the file header without decoding pixels"""
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+    with _probe_lock:
+        cached = _probe_cache.get(key)
+    if cached is not None:
+        return cached
+    
+    from PIL import Image
+    
+    # Image.open only parses the header; pixel data is read on load()
     try:
-        # Open image with PIL
-        img = Image.open(input_file)
-        
-        # Convert to RGB if needed
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
-        
-        # Initialize smartcrop
-        sc = smartcrop.SmartCrop()
-        
-        # Calculate crop area using ML attention detection
-        result = sc.crop(img, target_size, target_size)
-        
-        # Get the best crop coordinates
-        crop_box = result['top_crop']
-        x, y, width, height = crop_box['x'], crop_box['y'], crop_box['width'], crop_box['height']
-        
-        # Crop the image
-        cropped = img.crop((x, y, x + width, y + height))
-        
-        # Resize to exact target size
-        final = cropped.resize((target_size, target_size), Image.LANCZOS)
-        
-        # Save as PNG
-        final.save(output_file, 'PNG', optimize=True)
-        
-        return True
-    except Exception as e:
-        # Fallback to center crop if smart crop fails
+        with Image.open(path) as img:
+            info = header_info(img)
+    except Image.DecompressionBombError:
+        # Pillow refuses to even open huge images; they are resized by streaming
+        info = ping_image(path)
+    
+    with _probe_lock:
+        _probe_cache[key] = info
+    return info
+
+def probe_files(directory, files):
+    """Probe many files in parallel, returning {filename: info} for readable headers"""
+    def probe(filename):
         try:
-            result = subprocess.run(
-                ['magick', input_file, 
-                 '-resize', f'{target_size}x{target_size}^',
-                 '-gravity', 'center',
-                 '-extent', f'{target_size}x{target_size}',
-                 output_file],
-                capture_output=True, timeout=30
+            return filename, probe_image(os.path.join(directory, filename))
+        except Exception:
+            return filename, None
+    
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        return {name: info for name, info in executor.map(probe, files) if info is not None}
+
+# Leading signature of each format and the extensions that may carry it
+SIGNATURES = [
+    (b'\xff\xd8\xff', 'JPEG', ('.jpg', '.jpeg')),
+    (b'\x89PNG\r\n\x1a\n', 'PNG', ('.png',)),
+    (b'GIF87a', 'GIF', ('.gif',)),
+    (b'GIF89a', 'GIF', ('.gif',)),
+    (b'BM', 'BMP', ('.bmp',)),
+    (b'II*\x00', 'TIFF', ('.tif', '.tiff')),
+    (b'MM\x00*', 'TIFF', ('.tif', '.tiff')),
+]
+# How far from the end to look for an end marker, allowing for padding and
+# small trailers that some cameras and editors append
+TAIL_BYTES = 4096
+
+_validate_cache = {}
+_validate_lock = threading.Lock()
+
+def sniff_format(head):
+    """Format name and allowed extensions from a file's first bytes, or (None, ())"""
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'WEBP', ('.webp',)
+    for signature, name, extensions in SIGNATURES:
+        if head.startswith(signature):
+            return name, extensions
+    return None, ()
+
+def jpeg_end(path):
+    """Offset just past a JPEG's end-of-image marker, found by walking its segments, or None"""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size < 4:
+            return None
+        # Mapped rather than read, so a multi-gigabyte JPEG isn't loaded just to find its end
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return walk_jpeg(data)
+
+
+def walk_jpeg(data):
+    """Offset just past the end-of-image marker in a buffer holding a JPEG, or None"""
+    size = len(data)
+    pos = 2
+    while pos + 1 < size:
+        if data[pos] != 0xFF:
+            return None
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            # Fill byte before a marker
+            pos += 1
+            continue
+        if marker == 0xD9:
+            return pos + 2
+        if 0xD0 <= marker <= 0xD7 or marker == 0x01:
+            pos += 2
+            continue
+        if pos + 4 > size:
+            return None
+        pos += 2 + int.from_bytes(data[pos + 2:pos + 4], 'big')
+        if marker == 0xDA:
+            # Entropy-coded data runs to the next marker other than a stuffed
+            # FF 00 or a restart; progressive files have several of these scans
+            while True:
+                pos = data.find(b'\xff', pos)
+                if pos < 0 or pos + 1 >= size:
+                    return None
+                following = data[pos + 1]
+                if following == 0 or 0xD0 <= following <= 0xD7:
+                    pos += 2
+                elif following == 0xFF:
+                    pos += 1
+                else:
+                    break
+    return None
+
+def validate_image(path):
+    """Cheap integrity check from the first and last bytes: {'error'|'warning': reason} or None"""
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+    with _validate_lock:
+        if key in _validate_cache:
+            return _validate_cache[key]
+    
+    result = None
+    size = st.st_size
+    with open(path, 'rb') as f:
+        head = f.read(32)
+        f.seek(max(0, size - TAIL_BYTES))
+        tail = f.read()
+    
+    kind, extensions = sniff_format(head)
+    # Motion Photos, MPF and similar append data after the JPEG's end marker;
+    # only a walk of the segments tells them from a truncated file
+    jpeg_trailer = None
+    if kind == 'JPEG' and b'\xff\xd9' not in tail:
+        end = jpeg_end(path)
+        jpeg_trailer = size - end if end is not None else None
+    if size == 0:
+        result = {'error': 'Empty file'}
+    elif kind is None:
+        result = {'error': 'Not an image (unknown file signature)'}
+    elif kind == 'JPEG' and b'\xff\xd9' not in tail and jpeg_trailer is None:
+        result = {'error': 'Truncated JPEG (no end-of-image marker)', 'truncated': True}
+    elif kind == 'PNG' and b'IEND' not in tail:
+        result = {'error': 'Truncated PNG (no IEND chunk)', 'truncated': True}
+    elif kind == 'GIF' and not tail.rstrip(b'\x00').endswith(b'\x3b'):
+        result = {'error': 'Truncated GIF (no trailer)', 'truncated': True}
+    elif kind == 'WEBP' and int.from_bytes(head[4:8], 'little') + 8 > size:
+        result = {'error': 'Truncated WebP (shorter than its RIFF size)', 'truncated': True}
+    elif kind == 'BMP' and int.from_bytes(head[2:6], 'little') > size:
+        result = {'error': 'Truncated BMP (shorter than its header size)', 'truncated': True}
+    elif kind == 'TIFF' and int.from_bytes(head[4:8], 'little' if head[:2] == b'II' else 'big') >= size:
+        result = {'error': 'Truncated TIFF (first directory past end of file)', 'truncated': True}
+    else:
+        try:
+            info = probe_image(path)
+            if info['width'] <= 0 or info['height'] <= 0:
+                result = {'error': 'Invalid dimensions in header'}
+            elif jpeg_trailer:
+                result = {'warning': f'{jpeg_trailer // 1024} KB of extra data after the JPEG image'}
+        except Exception as e:
+            result = {'error': f'Unreadable header: {e}'}
+    if result is None and os.path.splitext(path)[1].lower() not in extensions:
+        # Decoders go by content, so a misnamed file still converts
+        result = {'warning': f'{kind} data with a {os.path.splitext(path)[1]} extension'}
+    
+    with _validate_lock:
+        _validate_cache[key] = result
+    return result
+
+def validate_files(directory, files):
+    """Validate many files in parallel, returning {filename: problem} for flagged files only"""
+    def validate(filename):
+        try:
+            return filename, validate_image(os.path.join(directory, filename))
+        except OSError as e:
+            return filename, {'error': str(e)}
+    
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        return {name: problem for name, problem in executor.map(validate, files) if problem}
+
+# Quality prefilter. Images are scored on a small square grayscale proxy and
+# rejected when their short side is under min_scale x resize_size, when more
+# than max_blank of the pixels share one flat tone, or when luma entropy (bits)
+# or Laplacian variance (sharpness) is below the minimum. Sharpness is judged
+# at proxy scale, so blur that vanishes on downscaling doesn't count; the
+# defaults only catch heavy blur, since clean skies and studio backdrops score
+# low too.
+QUALITY_PROXY_SIZE = 256
+QUALITY_BATCH_SIZE = 32
+QUALITY_FLAT_LEVELS = 8
+QUALITY_THRESHOLDS = {'min_scale': 0.5, 'min_sharpness': 15.0, 'min_entropy': 1.5, 'max_blank': 0.95}
+
+_quality_cache = {}
+_quality_lock = threading.Lock()
+
+def prefilter_thresholds(value):
+    """Thresholds for a prefilter request option (true or a dict of overrides), or None when off"""
+    if not value:
+        return None
+    thresholds = dict(QUALITY_THRESHOLDS)
+    if isinstance(value, dict):
+        thresholds.update({key: float(value[key]) for key in QUALITY_THRESHOLDS if value.get(key) is not None})
+    return thresholds
+
+def quality_proxy(path):
+    """QUALITY_PROXY_SIZE square grayscale proxy of an image as a uint8 array"""
+    from PIL import Image
+    import numpy as np
+    
+    size = (QUALITY_PROXY_SIZE, QUALITY_PROXY_SIZE)
+    info = probe_image(path)
+    if is_large(info):
+        proxy = stream_downsample(path, None, (0, 0, info['width'], info['height']), size).convert('L')
+    else:
+        with Image.open(path) as img:
+            # draft() lets JPEG decode at 1/2, 1/4 or 1/8 scale
+            img.draft('L', size)
+            proxy = img.convert('L').resize(size, Image.BOX)
+    return np.asarray(proxy, dtype=np.uint8)
+
+def score_proxies(proxies):
+    """Sharpness, entropy and flat-tone share of each proxy in an (n, size, size) stack"""
+    import numpy as np
+    
+    n = len(proxies)
+    pixels = proxies.astype(np.float32)
+    # 4-neighbour Laplacian over every proxy at once
+    laplacian = (pixels[:, :-2, 1:-1] + pixels[:, 2:, 1:-1] + pixels[:, 1:-1, :-2] + pixels[:, 1:-1, 2:]
+                 - 4 * pixels[:, 1:-1, 1:-1])
+    sharpness = laplacian.reshape(n, -1).var(axis=1)
+    
+    # One bincount for all histograms: offset each proxy's levels by 256 * index
+    levels = proxies.reshape(n, -1).astype(np.int64) + (np.arange(n) * 256)[:, None]
+    counts = np.bincount(levels.ravel(), minlength=n * 256).reshape(n, 256)
+    share = counts / counts.sum(axis=1, keepdims=True)
+    logs = np.log2(share, where=share > 0, out=np.zeros_like(share))
+    entropy = -(share * logs).sum(axis=1)
+    # Most pixels falling within a few adjacent levels means a flat, blank image
+    cumulative = np.pad(counts.cumsum(axis=1), ((0, 0), (1, 0)))
+    window = cumulative[:, QUALITY_FLAT_LEVELS:] - cumulative[:, :-QUALITY_FLAT_LEVELS]
+    blank = window.max(axis=1) / counts.sum(axis=1)
+    return sharpness, entropy, blank
+
+def score_batch(paths):
+    """{path: scores} for one batch, decoding only files not already cached"""
+    import numpy as np
+    
+    scores, keys, proxies = {}, [], []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            key = (path, st.st_mtime_ns, st.st_size)
+            with _quality_lock:
+                cached = _quality_cache.get(key)
+            if cached is not None:
+                scores[path] = cached
+            else:
+                proxies.append(quality_proxy(path))
+                keys.append(key)
+        except Exception:
+            # Undecodable files are left to the integrity check
+            continue
+    if proxies:
+        for key, sharpness, entropy, blank in zip(keys, *score_proxies(np.stack(proxies))):
+            result = {'sharpness': round(float(sharpness), 1), 'entropy': round(abs(float(entropy)), 2),
+                      'blank': round(float(blank), 3)}
+            with _quality_lock:
+                _quality_cache[key] = result
+            scores[key[0]] = result
+    return scores
+
+def prefilter_files(directory, files, resize_size, thresholds):
+    """Score files in parallel batches, returning {filename: scores and reason} for rejected files only"""
+    resize_size = int(resize_size) if resize_size else None
+    rejected = {}
+    candidates = []
+    # Resolution comes from cached header probes, so undersized files are never decoded
+    for name, info in probe_files(directory, files).items():
+        short_side = min(info['width'], info['height'])
+        if resize_size and short_side < thresholds['min_scale'] * resize_size:
+            rejected[name] = {'reject': 'too small',
+                              'detail': f"{info['width']}x{info['height']} for a {resize_size}px target"}
+        else:
+            candidates.append(os.path.join(directory, name))
+    
+    batches = [candidates[i:i + QUALITY_BATCH_SIZE] for i in range(0, len(candidates), QUALITY_BATCH_SIZE)]
+    with ThreadPoolExecutor(max_workers=CONVERT_WORKERS) as executor:
+        for scores in executor.map(score_batch, batches):
+            for path, score in scores.items():
+                if score['blank'] > thresholds['max_blank']:
+                    reason = 'blank', f"{score['blank']:.0%} one tone"
+                elif score['entropy'] < thresholds['min_entropy']:
+                    reason = 'low detail', f"entropy {score['entropy']:g} bits"
+                elif score['sharpness'] < thresholds['min_sharpness']:
+                    reason = 'blurry', f"sharpness {score['sharpness']:g}"
+                else:
+                    continue
+                rejected[os.path.basename(path)] = {**score, 'reject': reason[0], 'detail': reason[1]}
+    return rejected
+
+def frame_source(input_file, frame):
+    """ImageMagick input spec that decodes only the given frame of a multi-frame file"""
+    return input_file if frame is None else f'{input_file}[{frame}]'
+
+def target_dimensions(target_size):
+    """Normalize a square size or a (width, height) bucket to a (width, height) tuple"""
+    if isinstance(target_size, (tuple, list)):
+        return int(target_size[0]), int(target_size[1])
+    return int(target_size), int(target_size)
+
+def generate_buckets(base_size, step=BUCKET_STEP, max_aspect=BUCKET_MAX_ASPECT):
+    """Generate (width, height) buckets whose area fits within base_size x base_size"""
+    budget = base_size * base_size
+    buckets = set()
+    width = step
+    while width <= base_size * max_aspect:
+        height = (budget // width) // step * step
+        if height >= step and max(width / height, height / width) <= max_aspect:
+            buckets.add((width, height))
+            buckets.add((height, width))
+        width += step
+    return sorted(buckets, key=lambda b: b[0] / b[1])
+
+def parse_buckets(spec, base_size):
+    """Parse a user bucket list ("832x1216" strings or pairs), keeping those within the pixel budget"""
+    budget = base_size * base_size
+    buckets = set()
+    for item in spec:
+        if isinstance(item, str):
+            width, height = item.lower().split('x')
+        else:
+            width, height = item
+        width, height = int(width), int(height)
+        if width > 0 and height > 0 and width * height <= budget:
+            buckets.add((width, height))
+    return sorted(buckets, key=lambda b: b[0] / b[1])
+
+def nearest_bucket(width, height, buckets):
+    """Pick the bucket whose aspect ratio is closest to the image's (compared in log space)"""
+    ratio = math.log(width / height)
+    return min(buckets, key=lambda b: abs(math.log(b[0] / b[1]) - ratio))
+
+def assign_buckets(directory, files, base_size, bucket_spec=None):
+    """Assign each file to its nearest bucket using header-probed dimensions only"""
+    if bucket_spec:
+        buckets = parse_buckets(bucket_spec, base_size)
+    else:
+        buckets = generate_buckets(base_size)
+    if not buckets:
+        raise ValueError('No buckets fit within the pixel budget')
+    
+    assignments = {}
+    failed = []
+    for filename in files:
+        try:
+            info = probe_image(os.path.join(directory, filename))
+            assignments[filename] = nearest_bucket(info['width'], info['height'], buckets)
+        except Exception:
+            failed.append(filename)
+    return buckets, assignments, failed
+
+@app.route('/buckets', methods=['POST'])
+def bucket_histogram():
+    """Preview aspect-ratio bucket assignments before processing"""
+    data = request.json
+    directory = data.get('directory', os.getcwd())
+    files = data.get('files', [])
+    resize_size = data.get('resize_size', '')
+    
+    if is_archive(directory):
+        return jsonify({'success': False, 'error': 'Archive sources are not bucketed'})
+    if not os.path.isdir(directory):
+        return jsonify({'success': False, 'error': 'Invalid directory path'})
+    if not resize_size:
+        return jsonify({'success': False, 'error': 'Bucketing requires a resize size'})
+    
+    try:
+        buckets, assignments, failed = assign_buckets(
+            directory, files, int(resize_size), data.get('buckets'))
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+    
+    counts = {}
+    for bucket in assignments.values():
+        counts[bucket] = counts.get(bucket, 0) + 1
+    histogram = [{'width': w, 'height': h, 'count': counts.get((w, h), 0)} for w, h in buckets]
+    
+    return jsonify({
+        'success': True,
+        'histogram': [entry for entry in histogram if entry['count']],
+        'assignments': {f: f'{w}x{h}' for f, (w, h) in assignments.items()},
+        'failed': failed
+    })
+
+# Resampling quality tiers: "fast" box-averages by an integer factor and
+# finishes with a cheap filter, "balanced" box-averages down to REDUCING_GAP
+# times the target before the final high-quality pass, "best" resamples the
+# full-resolution crop in one Lanczos (Pillow) / default-filter (magick) pass
+QUALITY_TIERS = ('fast', 'balanced', 'best')
+REDUCING_GAP = 2.0
+
+def pil_resize(img, size, quality='best'):
+    """Resize a Pillow image to an exact size using the quality tier's strategy"""
+    from PIL import Image
+    
+    if quality == 'fast':
+        factor = min(img.width // size[0], img.height // size[1])
+        if factor >= 2:
+            img = img.reduce(factor)
+        return img.resize(size, Image.BILINEAR)
+    if quality == 'balanced':
+        return img.resize(size, Image.LANCZOS, reducing_gap=REDUCING_GAP)
+    return img.resize(size, Image.LANCZOS)
+
+def magick_resize_args(width, height, quality='best'):
+    """ImageMagick arguments resizing to exactly width x height for a quality tier"""
+    if quality == 'fast':
+        # -scale is a plain box average straight to the target
+        return ['-scale', f'{width}x{height}!']
+    if quality == 'balanced':
+        # Box-average to REDUCING_GAP x target (only if larger), then filter the rest
+        return ['-scale', f'{int(width * REDUCING_GAP)}x{int(height * REDUCING_GAP)}>',
+                '-resize', f'{width}x{height}!']
+    return ['-resize', f'{width}x{height}!']
+
+def center_crop_box(width, height, target_width, target_height):
+    """Largest centered (x, y, width, height) box with the target's aspect ratio"""
+    target_ratio = target_width / target_height
+    if width / height > target_ratio:
+        # Wider - crop width
+        new_width = max(1, round(height * target_ratio))
+        return (width - new_width) // 2, 0, new_width, height
+    # Taller - crop height
+    new_height = max(1, round(width / target_ratio))
+    return 0, (height - new_height) // 2, width, new_height
+
+def resize_center_crop(input_file, output_file, target_size, frame=None, quality='best'):
+    """Resize and center crop image (target_size is a square side or a (width, height) bucket)"""
+    try:
+        target_width, target_height = target_dimensions(target_size)
+        source = frame_source(input_file, frame)
+        
+        # Get dimensions
+        result = subprocess.run(
+            ['identify', '-format', '%wx%h', source],
+            capture_output=True, text=True, timeout=5
+        )
+        if result.returncode != 0:
+            return False
+        
+        dims = result.stdout.strip().split('x')
+        width, height = int(dims[0]), int(dims[1])
+        
+        # Calculate crop dimensions
+        x, y, crop_width, crop_height = center_crop_box(width, height, target_width, target_height)
+        crop_geometry = f"{crop_width}x{crop_height}+{x}+{y}"
+        
+        # Crop and resize (the "!" forces exact bucket dimensions after rounding)
+        result = subprocess.run(
+            ['magick', source, '-crop', crop_geometry, '+repage',
+             *magick_resize_args(target_width, target_height, quality), output_file],
+            capture_output=True, timeout=30
+        )
+        
+        return result.returncode == 0
+    except Exception:
+        return False
+
+_digest_cache = {}
+_digest_lock = threading.Lock()
+
+def file_digest(path):
+    """Content hash of a file (BLAKE2b-128), memoized by path, mtime and size"""
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+    with _digest_lock:
+        cached = _digest_cache.get(key)
+    if cached is not None:
+        return cached
+    
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    digest = h.hexdigest()
+    with _digest_lock:
+        _digest_cache[key] = digest
+    return digest
+
+def crop_aspect_key(target_width, target_height):
+    """Reduced aspect ratio, so 512x512 and 1024x1024 share cached boxes"""
+    divisor = math.gcd(target_width, target_height)
+    return f'{target_width // divisor}:{target_height // divisor}'
+
+def smartcrop_params_key(frame=None):
+    """Identifies the analysis settings a cached box was computed with"""
+    import smartcrop
+    version = getattr(smartcrop, '__version__', 'unknown')
+    return f'smartcrop-{version}/defaults/frame-{frame or 0}'
+
+class CropCache:
+    """On-disk store of smart-crop boxes keyed by content hash, crop aspect and analysis params"""
+    
+    EVICT_EVERY = 1000
+    
+    def __init__(self, path, max_entries):
+        self.path = path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self._db = None
+        self._writes = 0
+    
+    def _connect(self):
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('''CREATE TABLE IF NOT EXISTS crops (
+                digest TEXT NOT NULL, aspect TEXT NOT NULL, params TEXT NOT NULL,
+                x INTEGER NOT NULL, y INTEGER NOT NULL, width INTEGER NOT NULL, height INTEGER NOT NULL,
+                override INTEGER NOT NULL DEFAULT 0, last_used REAL NOT NULL,
+                PRIMARY KEY (digest, aspect, params)) WITHOUT ROWID''')
+            self._db.execute('CREATE INDEX IF NOT EXISTS crops_lru ON crops (override, last_used)')
+        return self._db
+    
+    def get(self, digest, aspect, params):
+        """Return (box, override) or None; manual overrides apply to any analysis params"""
+        with self.lock:
+            db = self._connect()
+            row = db.execute(
+                'SELECT x, y, width, height, override, params FROM crops WHERE digest = ? AND aspect = ? '
+                'AND (params = ? OR override = 1) ORDER BY override DESC LIMIT 1',
+                (digest, aspect, params)).fetchone()
+            if row is None:
+                return None
+            db.execute('UPDATE crops SET last_used = ? WHERE digest = ? AND aspect = ? AND params = ?',
+                       (time.time(), digest, aspect, row[5]))
+        return tuple(row[:4]), bool(row[4])
+    
+    def put(self, digest, aspect, params, box, override=False):
+        with self.lock:
+            db = self._connect()
+            if override:
+                # A manual box replaces every analysed box for this image and aspect
+                db.execute('DELETE FROM crops WHERE digest = ? AND aspect = ?', (digest, aspect))
+            db.execute(
+                'INSERT OR REPLACE INTO crops VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (digest, aspect, params, *[int(v) for v in box], int(override), time.time()))
+            self._writes += 1
+            if self._writes % self.EVICT_EVERY == 0:
+                self._evict(db)
+    
+    def delete(self, digest, aspect):
+        with self.lock:
+            self._connect().execute('DELETE FROM crops WHERE digest = ? AND aspect = ?', (digest, aspect))
+    
+    def _evict(self, db):
+        count = db.execute('SELECT COUNT(*) FROM crops').fetchone()[0]
+        if count <= self.max_entries:
+            return
+        # Trim to 90% so eviction doesn't run on every subsequent write
+        excess = count - int(self.max_entries * 0.9)
+        db.execute(
+            'DELETE FROM crops WHERE (digest, aspect, params) IN (SELECT digest, aspect, params FROM crops '
+            'WHERE override = 0 ORDER BY last_used LIMIT ?)', (excess,))
+
+CROP_CACHE = CropCache(CROP_CACHE_PATH, CROP_CACHE_MAX_ENTRIES)
+
+def clamp_box(box, width, height):
+    """Keep a (possibly hand-edited) box inside the image"""
+    x, y, box_width, box_height = (int(v) for v in box)
+    x = min(max(0, x), width - 1)
+    y = min(max(0, y), height - 1)
+    return x, y, max(1, min(box_width, width - x)), max(1, min(box_height, height - y))
+
+def smart_crop_region(img, digest, target_width, target_height, frame=None, source_size=None):
+    """Smart-crop box (x, y, width, height) for an RGB image, through the crop cache
+
+    When img is a downscaled proxy, source_size is the full image's size and the
+    box is returned (and cached) in full-resolution coordinates.
+    """
+    import smartcrop
+    
+    width, height = source_size or img.size
+    # Reuse a cached (or manually overridden) box for this content and aspect
+    cache_key = None
+    cached = None
+    if digest is not None:
+        try:
+            cache_key = (digest, crop_aspect_key(target_width, target_height), smartcrop_params_key(frame))
+            cached = CROP_CACHE.get(*cache_key)
+        except sqlite3.Error:
+            pass
+    if cached is not None:
+        return clamp_box(cached[0], width, height)
+    
+    # Initialize smartcrop
+    sc = smartcrop.SmartCrop()
+    
+    # Calculate crop area using ML attention detection
+    result = sc.crop(img, target_width, target_height)
+    
+    # Get the best crop coordinates
+    crop_box = result['top_crop']
+    box = crop_box['x'], crop_box['y'], crop_box['width'], crop_box['height']
+    if source_size:
+        scale = width / img.width
+        box = clamp_box([round(v * scale) for v in box], width, height)
+    if cache_key is not None:
+        try:
+            CROP_CACHE.put(*cache_key, box)
+        except sqlite3.Error:
+            pass
+    return box
+
+def resize_smart_crop(input_file, output_file, target_size, frame=None, quality='best'):
+    """Resize with AI-based smart cropping using attention detection"""
+    target_width, target_height = target_dimensions(target_size)
+    try:
+        from PIL import Image
+        
+        # Open image with PIL
+        img = Image.open(input_file)
+        
+        # Seek straight to the chosen frame; other frames are never decoded
+        if frame:
+            img.seek(frame)
+        
+        # Convert to RGB if needed
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        
+        try:
+            digest = file_digest(input_file)
+        except OSError:
+            digest = None
+        x, y, width, height = smart_crop_region(img, digest, target_width, target_height, frame)
+        
+        # Crop the image
+        cropped = img.crop((x, y, x + width, y + height))
+        
+        # Resize to exact target size
+        final = pil_resize(cropped, (target_width, target_height), quality)
+        
+        # Save as PNG
+        final.save(output_file, 'PNG', optimize=True)
+        
+        return True
+    except Exception as e:
+        # Fallback to center crop if smart crop fails
+        try:
+            result = subprocess.run(
+                ['magick', frame_source(input_file, frame), 
+                 '-resize', f'{target_width}x{target_height}^',
+                 '-gravity', 'center',
+                 '-extent', f'{target_width}x{target_height}',
+                 output_file],
+                capture_output=True, timeout=30
             )
             return result.returncode == 0
         except Exception:
             return False
 
+# Resizing an image above this many pixels never decodes it whole: ImageMagick
+# streams the rows of the needed region and they are box-averaged on the fly
+LARGE_IMAGE_PIXELS = int(float(os.environ.get('MAGICRENAMER_LARGE_IMAGE_MP', 100)) * 1e6)
+# Source rows buffered per band while streaming, and the smart-crop proxy size
+STREAM_BAND_ROWS = 256
+STREAM_PROXY_SIZE = 1024
+
+def stream_downsample(input_file, frame, box, size, timeout=600):
+    """Box-average region box = (x, y, w, h) of an image down to size, streaming its rows"""
+    from PIL import Image
+    
+    x, y, width, height = box
+    out_width, out_height = size
+    row_bytes = width * 3
+    scale = height / out_height
+    # Output rows per band, so that a band covers about STREAM_BAND_ROWS source rows
+    band = max(1, int(STREAM_BAND_ROWS / scale))
+    
+    # "magick stream" decodes row by row and writes raw pixels of just the
+    # extracted region; the full raster is never held by either process
+    process = subprocess.Popen(
+        ['magick', 'stream', '-map', 'rgb', '-storage-type', 'char',
+         '-extract', f'{width}x{height}+{x}+{y}', frame_source(input_file, frame), '-'],
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    deadline = time.time() + timeout
+    out = Image.new('RGB', size)
+    buffer = bytearray()
+    base = 0
+    try:
+        row = 0
+        while row < out_height:
+            rows = min(band, out_height - row)
+            top, bottom = row * scale, (row + rows) * scale
+            needed = min(height, math.ceil(bottom)) - base
+            while len(buffer) < needed * row_bytes:
+                chunk = process.stdout.read(needed * row_bytes - len(buffer))
+                if not chunk:
+                    raise RuntimeError('image stream ended early')
+                buffer += chunk
+                if time.time() > deadline:
+                    raise TimeoutError('image stream timed out')
+            
+            # Exact area averaging of the fractional source span [top, bottom)
+            strip = Image.frombuffer('RGB', (width, needed), bytes(buffer[:needed * row_bytes]), 'raw', 'RGB', 0, 1)
+            out.paste(strip.resize((out_width, rows), Image.BOX, box=(0, top - base, width, bottom - base)), (0, row))
+            
+            consumed = int(bottom) - base
+            del buffer[:consumed * row_bytes]
+            base += consumed
+            row += rows
+    finally:
+        process.kill()
+        process.wait()
+    return out
+
+def resize_streamed(input_file, output_file, target_size, crop_mode, info, frame=None, quality='best'):
+    """Crop and resize a very large image with memory proportional to the output, not the source"""
+    target_width, target_height = target_dimensions(target_size)
+    width, height = info['width'], info['height']
+    try:
+        if crop_mode == 'smart':
+            # Saliency is analysed on a streamed proxy; the box is scaled back up
+            ratio = max(width, height) / STREAM_PROXY_SIZE
+            proxy = stream_downsample(input_file, frame, (0, 0, width, height),
+                                      (max(1, round(width / ratio)), max(1, round(height / ratio))))
+            try:
+                digest = file_digest(input_file)
+            except OSError:
+                digest = None
+            box = smart_crop_region(proxy, digest, target_width, target_height, frame, source_size=(width, height))
+            del proxy
+        else:
+            box = center_crop_box(width, height, target_width, target_height)
+        
+        # Stream the crop down to REDUCING_GAP x the target (the target itself for
+        # "fast"), then finish with one Lanczos pass on the small image
+        if quality == 'fast':
+            size = (target_width, target_height)
+        else:
+            size = (min(box[2], round(target_width * REDUCING_GAP)), min(box[3], round(target_height * REDUCING_GAP)))
+        img = stream_downsample(input_file, frame, box, size)
+        if img.size != (target_width, target_height):
+            img = pil_resize(img, (target_width, target_height), 'best')
+        img.save(output_file, 'PNG', optimize=True)
+        return True
+    except Exception:
+        return False
+
+def is_large(info):
+    """True when an image is resized through resize_streamed()"""
+    return info['width'] * info['height'] > LARGE_IMAGE_PIXELS
+
+# Bytes per pixel of a decoded Pillow image by mode
+PIL_MODE_BYTES = {'1': 1, 'L': 1, 'P': 1, 'LA': 2, 'PA': 2, 'I;16': 2, 'RGB': 3, 'YCbCr': 3,
+                  'LAB': 3, 'HSV': 3, 'RGBA': 4, 'RGBX': 4, 'CMYK': 4, 'I': 4, 'F': 4}
+# ImageMagick Q16-HDRI keeps four float channels per pixel in its pixel cache
+MAGICK_PIXEL_BYTES = 16
+
+def estimate_task_memory(info, target, crop_mode):
+    """Estimate a conversion's peak memory in bytes from probed dimensions and mode"""
+    pixels = info['width'] * info['height']
+    if target:
+        target_width, target_height = target_dimensions(target)
+        target_pixels = target_width * target_height
+    else:
+        target_pixels = pixels
+    
+    if target and is_large(info):
+        # Streamed: a band of source rows, the 2x intermediate and the result
+        # (plus the saliency proxy for smart crops), never the full raster
+        band = info['width'] * 3 * STREAM_BAND_ROWS * 2
+        proxy = STREAM_PROXY_SIZE ** 2 * 3 * 4 if crop_mode == 'smart' else 0
+        return band + proxy + int(target_pixels * 3 * (REDUCING_GAP ** 2 + 2))
+    
+    if target and crop_mode == 'smart':
+        # Decoded image, RGB copy, crop and resized result are all alive at once
+        decoded = pixels * PIL_MODE_BYTES.get(info['mode'], 4)
+        rgb_copy = 0 if info['mode'] == 'RGB' else pixels * 3
+        return decoded + rgb_copy + pixels * 3 + target_pixels * 3
+    
+    # ImageMagick holds the source, the cropped region and the resized output
+    return (pixels * 2 + target_pixels) * MAGICK_PIXEL_BYTES
+
+class MemoryAdmission:
+    """Server-wide memory budget that every job's tasks are admitted against"""
+    
+    def __init__(self, budget_bytes):
+        self.budget = budget_bytes
+        self.in_use = 0
+        self.condition = threading.Condition()
+    
+    def try_acquire(self, cost):
+        with self.condition:
+            # An oversized task waits until nothing else is running anywhere
+            if self.in_use and self.in_use + cost > self.budget:
+                return False
+            self.in_use += cost
+            return True
+    
+    def release(self, cost):
+        with self.condition:
+            self.in_use -= cost
+            self.condition.notify_all()
+    
+    def wait(self, timeout):
+        """Block until some task releases memory, or timeout"""
+        with self.condition:
+            self.condition.wait(timeout)
+
+ADMISSION = MemoryAdmission(MEMORY_BUDGET_MB * 1024 ** 2)
+# How often a job blocked only by other jobs' memory re-checks the budget
+ADMISSION_POLL_SECONDS = 0.25
+
+class MemoryBudgetScheduler:
+    """Run tasks concurrently while their summed peak-memory estimates stay under a budget"""
+    
+    def __init__(self, budget_bytes, workers):
+        self.budget = budget_bytes
+        self.workers = max(1, workers)
+        self.in_use = 0
+        self.peak = 0
+        self.oversized = 0
+        self.deferred = 0
+        self._usage_time = 0.0
+        self._last_change = None
+        self._started = None
+        self.timeouts = 0
+        self.crashes = 0
+        self.recycles = 0
+    
+    def _account(self):
+        now = time.monotonic()
+        if self._last_change is not None:
+            self._usage_time += self.in_use * (now - self._last_change)
+        self._last_change = now
+    
+    def fits(self, cost, running):
+        """Whether the job's own budget has room; its first task always does"""
+        return running == 0 or self.in_use + cost <= self.budget
+    
+    def run(self, tasks, fn):
+        """Yield (task, result, error) as tasks finish; tasks are (cost, args, deadline) admitted in order"""
+        pending = deque(tasks)
+        running = {}
+        self._started = self._last_change = time.monotonic()
+        
+        executor = convert_pool(self.workers)
+        blocked = None
+        
+        while pending or running:
+            waiting_on_others = False
+            while pending and len(running) < self.workers:
+                task = pending[0]
+                cost = task[0]
+                admitted = self.fits(cost, len(running)) and ADMISSION.try_acquire(cost)
+                if not admitted:
+                    # Count each task held back by memory once, not every pass
+                    if blocked is not task:
+                        blocked = task
+                        self.deferred += 1
+                    waiting_on_others = self.fits(cost, len(running))
+                    break
+                pending.popleft()
+                if cost > ADMISSION.budget:
+                    self.oversized += 1
+                self._account()
+                self.in_use += cost
+                self.peak = max(self.peak, self.in_use)
+                future = executor.submit(fn, *task[1], timeout=task[2])
+                # Released when the task ends, even if this job is abandoned
+                future.add_done_callback(lambda _, cost=cost: ADMISSION.release(cost))
+                running[future] = task
+            
+            if not running:
+                ADMISSION.wait(ADMISSION_POLL_SECONDS)
+                continue
+            # Memory freed by other jobs doesn't complete any of our futures
+            timeout = ADMISSION_POLL_SECONDS if waiting_on_others else None
+            done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                task = running.pop(future)
+                self._account()
+                self.in_use -= task[0]
+                # The pool is shared between jobs, so count this job's share here
+                self.recycles += future.recycled
+                try:
+                    result = future.result()
+                except Exception as e:
+                    self.timeouts += isinstance(e, TaskTimeout)
+                    self.crashes += isinstance(e, WorkerCrashed)
+                    yield task, None, e
+                else:
+                    yield task, result, None
+        self._account()
+    
+    def stats(self):
+        elapsed = (self._last_change - self._started) if self._started is not None else 0
+        average = self._usage_time / elapsed if elapsed > 0 else 0
+        return {
+            'workers': self.workers,
+            'memory_budget_mb': round(self.budget / 1024 ** 2, 1),
+            'peak_memory_mb': round(self.peak / 1024 ** 2, 1),
+            'peak_utilization': round(self.peak / self.budget, 3) if self.budget else 0,
+            'average_utilization': round(average / self.budget, 3) if self.budget else 0,
+            'oversized_tasks': self.oversized,
+            'deferred_admissions': self.deferred,
+            'task_timeouts': self.timeouts,
+            'worker_recycles': self.recycles,
+            'worker_crashes': self.crashes,
+        }
+
+def task_deadline(megapixels):
+    """Seconds a conversion of this many source megapixels may run before it is killed"""
+    return TASK_TIMEOUT_SECONDS + megapixels
+
+class TaskTimeout(Exception):
+    """A task ran past its deadline and its worker was killed"""
+
+class WorkerCrashed(Exception):
+    """A worker process died while running a task"""
+
+def resident_memory():
+    """Resident set size of the current process in bytes (0 if unknown)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+def worker_main(conn, max_tasks, max_rss):
+    """Worker process loop: run (fn, args) from conn until closed or due for recycling"""
+    if hasattr(os, 'setpgrp'):
+        # Own process group, so killing the worker also kills any magick it started
+        os.setpgrp()
+    done = 0
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            return
+        if message is None:
+            return
+        fn, args = message
+        try:
+            result, error = fn(*args), None
+        except Exception as e:
+            result, error = None, e
+        done += 1
+        retire = bool(max_tasks and done >= max_tasks) or bool(max_rss and resident_memory() > max_rss)
+        try:
+            conn.send((result, error, retire))
+        except Exception:
+            # Unpicklable exception; pickling fails before anything is written
+            conn.send((None, RuntimeError(str(error)), retire))
+        if retire:
+            return
+
+def worker_context():
+    """multiprocessing context for workers: forked from a preloaded server where available"""
+    if 'forkserver' not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('spawn')
+    context = multiprocessing.get_context('forkserver')
+    # Forking Flask's threaded process directly is unsafe; the fork server
+    # imports this module and the imaging libraries once, so new and recycled
+    # workers start warm in milliseconds
+    context.set_forkserver_preload([__name__, 'PIL.Image', 'smartcrop'])
+    return context
+
+class SupervisedPool:
+    """Executor of worker processes with per-task deadlines, kill-and-replace and recycling"""
+    
+    def __init__(self, workers, timeout=TASK_TIMEOUT_SECONDS, max_tasks=WORKER_MAX_TASKS,
+                 max_rss_mb=WORKER_MAX_RSS_MB):
+        self.timeout = timeout
+        self.max_tasks = max_tasks
+        self.max_rss = max_rss_mb * 1024 ** 2
+        self.context = worker_context()
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.started = 0
+        self.timeouts = 0
+        self.recycles = 0
+        self.crashes = 0
+        self.slots = []
+        self.grow(workers)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.shutdown()
+    
+    def grow(self, workers):
+        """Add slots until there are at least this many workers"""
+        with self.lock:
+            # One supervising thread per slot owns that slot's worker process
+            while len(self.slots) < max(1, workers):
+                slot = threading.Thread(target=self._supervise, daemon=True)
+                slot.start()
+                self.slots.append(slot)
+    
+    def submit(self, fn, *args, timeout=None):
+        """Run fn(*args) in a worker; fn and args must be picklable (module-level)"""
+        future = Future()
+        future.recycled = False
+        # A zero or negative timeout disables the deadline
+        self.queue.put((future, fn, args, (timeout or self.timeout) if self.timeout > 0 else None))
+        return future
+    
+    def shutdown(self):
+        """Cancel queued tasks and stop every worker once its current task is done"""
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                item[0].cancel()
+        for _ in self.slots:
+            self.queue.put(None)
+        for slot in self.slots:
+            slot.join()
+    
+    def _count(self, counter):
+        with self.lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+    
+    def _start(self):
+        conn, child = self.context.Pipe()
+        process = self.context.Process(target=worker_main, args=(child, self.max_tasks, self.max_rss),
+                                       daemon=True)
+        process.start()
+        child.close()
+        self._count('started')
+        return process, conn
+    
+    def _kill(self, process, conn):
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except (AttributeError, OSError):
+            # Not yet its own group leader (or no process groups here)
+            process.kill()
+        process.join()
+        conn.close()
+    
+    def _supervise(self):
+        process = conn = None
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            future, fn, args, timeout = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            if process is None:
+                process, conn = self._start()
+            try:
+                conn.send((fn, args))
+                finished = conn.poll(timeout)
+                if finished:
+                    result, error, retire = conn.recv()
+            except (EOFError, OSError):
+                process.join()
+                self._count('crashes')
+                future.set_exception(WorkerCrashed(f'worker exited with code {process.exitcode}'))
+                conn.close()
+                process = conn = None
+                continue
+            except Exception as e:
+                # e.g. unpicklable arguments; the pipe may be half-written
+                self._kill(process, conn)
+                process = conn = None
+                future.set_exception(e)
+                continue
+            
+            if not finished:
+                self._kill(process, conn)
+                process = conn = None
+                self._count('timeouts')
+                future.set_exception(TaskTimeout(f'no result after {timeout:.1f}s, worker killed'))
+                continue
+            if retire:
+                process.join()
+                conn.close()
+                process = conn = None
+                self._count('recycles')
+                future.recycled = True
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+        
+        if process is not None:
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+            process.join()
+            conn.close()
+    
+    def stats(self):
+        return {
+            'workers': len(self.slots),
+            'workers_started': self.started,
+            'task_timeouts': self.timeouts,
+            'worker_recycles': self.recycles,
+            'worker_crashes': self.crashes,
+        }
+
+_convert_pool = None
+_convert_pool_lock = threading.Lock()
+
+def convert_pool(workers=CONVERT_WORKERS):
+    """The server's shared conversion pool, grown to at least this many workers (at most CONVERT_WORKERS)"""
+    global _convert_pool
+    # The pool never shrinks, so a request must not be able to size it
+    workers = max(1, min(workers, CONVERT_WORKERS))
+    with _convert_pool_lock:
+        if _convert_pool is None:
+            _convert_pool = SupervisedPool(workers)
+        else:
+            _convert_pool.grow(workers)
+    return _convert_pool
+
+# Single-frame PNGs in these modes load the same everywhere; re-encoding them
+# only costs time and can only change the file, never improve it
+CONFORMING_MODES = {'L', 'LA', 'RGB', 'RGBA'}
+
+def is_conforming(info, target):
+    """True when a probed file already is the output: a plain PNG at the target size"""
+    if info['format'] != 'PNG' or info['frames'] != 1 or info['mode'] not in CONFORMING_MODES:
+        return False
+    return not target or (info['width'], info['height']) == target_dimensions(target)
+
+# Linux ioctl that clones a file's extents (copy-on-write) on btrfs, XFS, bcachefs...
+FICLONE = 0x40049409
+
+def place_file(source, destination):
+    """Put source's content at destination without copying data where possible"""
+    # Reflinks share blocks until either side is written; hardlinks share the
+    # inode, so only fall back to them when cloning is not supported
+    try:
+        import fcntl
+        with open(source, 'rb') as src, open(destination, 'wb') as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        return 'reflink'
+    except (ImportError, OSError):
+        if os.path.exists(destination):
+            os.unlink(destination)
+    try:
+        os.link(source, destination)
+        return 'hardlink'
+    except OSError:
+        shutil.copy2(source, destination)
+        return 'copy'
+
+def convert_file(input_file, output_file, target, crop_mode, frame=None, quality='best'):
+    """Convert one image to PNG, cropping and resizing when a target size is given"""
+    if target:
+        try:
+            info = probe_image(input_file)
+        except Exception:
+            info = None
+        if info and is_large(info):
+            return resize_streamed(input_file, output_file, target, crop_mode, info, frame, quality)
+        if crop_mode == 'smart':
+            return resize_smart_crop(input_file, output_file, target, frame, quality)
+        return resize_center_crop(input_file, output_file, target, frame, quality)
+    
+    # Without a frame selector magick writes one numbered PNG per frame
+    result = subprocess.run(
+        ['magick', frame_source(input_file, frame), output_file],
+        capture_output=True, text=True, timeout=30
+    )
+    return result.returncode == 0
+
+@app.route('/crops', methods=['GET', 'POST'])
+def crop_boxes():
+    """Inspect or override the cached smart-crop box of one image for one aspect ratio"""
+    data = request.args if request.method == 'GET' else request.json
+    directory = os.path.abspath(os.path.expanduser(data.get('directory', data.get('dir', ''))))
+    filename = data.get('file', '')
+    path = os.path.join(directory, filename)
+    if not filename or not os.path.isfile(path):
+        return jsonify({'success': False, 'error': 'File not found'})
+    
+    try:
+        width, height = int(data.get('width')), int(data.get('height'))
+        frame = int(data.get('frame') or 0) or None
+        key = (file_digest(path), crop_aspect_key(width, height))
+        
+        if request.method == 'POST':
+            box = data.get('box')
+            if box is None:
+                CROP_CACHE.delete(*key)
+            else:
+                info = probe_image(path)
+                box = clamp_box((box['x'], box['y'], box['width'], box['height']), info['width'], info['height'])
+                CROP_CACHE.put(*key, smartcrop_params_key(frame), box, override=True)
+        
+        cached = CROP_CACHE.get(*key, smartcrop_params_key(frame))
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+    
+    if cached is None:
+        return jsonify({'success': True, 'box': None, 'override': False})
+    return jsonify({'success': True,
+                    'box': dict(zip(('x', 'y', 'width', 'height'), cached[0])),
+                    'override': cached[1]})
+
+def job_options(data):
+    """Normalize job parameters shared by /process, /plan and the CLI"""
+    resize_size = data.get('resize_size', '')
+    return {
+        'prefix': data.get('prefix', ''),
+        'resize_size': resize_size,
+        'crop_mode': data.get('crop_mode', 'center'),
+        'bucket': bool(data.get('bucket')) and bool(resize_size),
+        'buckets': data.get('buckets'),
+        'workers': max(1, min(int(data.get('workers') or CONVERT_WORKERS), CONVERT_WORKERS)),
+        'memory_budget': max(1, min(int(data.get('memory_budget_mb') or MEMORY_BUDGET_MB),
+                                    MEMORY_BUDGET_MB)) * 1024 ** 2,
+        'frame': max(0, int(data.get('frame') or 0)),
+        'smart_boxes': bool(data.get('smart_boxes')),
+        'quality': data.get('quality') if data.get('quality') in QUALITY_TIERS else 'best',
+        'reencode': bool(data.get('reencode')),
+        'output_dir': data.get('output_dir') or None,
+        'append': bool(data.get('append')),
+        'prefilter': prefilter_thresholds(data.get('prefilter')),
+    }
+
+def sequence_name(prefix, number):
+    """Final output name for a sequence number"""
+    return f"{prefix}-{number}.png" if prefix else f"{number}.png"
+
+def sequence_number(prefix, filename):
+    """Sequence number of an output name for this prefix, or None"""
+    match = re.fullmatch(rf'{re.escape(prefix)}-(\d+)\.png' if prefix else r'(\d+)\.png', filename)
+    return int(match.group(1)) if match else None
+
+def next_sequence_number(directory, prefix):
+    """One past the highest existing output number in directory (1 when there are none)"""
+    highest = 0
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                number = sequence_number(prefix, entry.name)
+                if number is not None:
+                    highest = max(highest, number)
+    except FileNotFoundError:
+        # An output directory /process would create has no outputs yet
+        pass
+    return highest + 1
+
+def output_conflict(source, out_root, prefix, append):
+    """Error message when a job would overwrite earlier results in a separate output directory"""
+    if append or os.path.realpath(out_root) == os.path.realpath(source):
+        return None
+    if next_sequence_number(out_root, prefix) > 1:
+        return (f"{out_root} already contains {sequence_name(prefix, 'N')} outputs; "
+                f"use append to continue after them, or choose another directory")
+    return None
+
+# Rough planning model: PNG compresses to about this fraction of raw pixel
+# bytes for photographic content, and each stage/backend spends about this
+# long per source megapixel on one core until CostModel has measured it
+PLAN_PNG_RATIO = 0.6
+PLAN_SECONDS_PER_MEGAPIXEL = {'convert/magick': 0.05, 'center/magick': 0.06, 'smart/pillow': 0.15}
+
+def task_stage(target, crop_mode, quality='best'):
+    """Cost-model key (stage/backend, plus the quality tier when not "best") for a conversion"""
+    if not target:
+        return 'convert/magick'
+    stage = 'smart/pillow' if crop_mode == 'smart' else 'center/magick'
+    return stage if quality == 'best' else f'{stage}:{quality}'
+
+class CostModel:
+    """Online least-squares fit of seconds = fixed + per_mp * megapixels for each stage/backend"""
+    
+    def __init__(self, priors, decay=0.98):
+        self.priors = priors
+        # Exponential forgetting keeps the fit tracking the current machine load
+        self.decay = decay
+        self.sums = {}
+        self.lock = threading.Lock()
+    
+    def observe(self, stage, megapixels, seconds):
+        with self.lock:
+            n, sx, sy, sxx, sxy = self.sums.get(stage, (0.0, 0.0, 0.0, 0.0, 0.0))
+            d = self.decay
+            self.sums[stage] = (n * d + 1, sx * d + megapixels, sy * d + seconds,
+                                sxx * d + megapixels * megapixels, sxy * d + megapixels * seconds)
+    
+    def coefficients(self, stage):
+        """(fixed seconds, seconds per megapixel) for a stage"""
+        with self.lock:
+            sums = self.sums.get(stage)
+        if sums is None:
+            return 0.0, self.priors.get(stage.split(':')[0], 0.1)
+        
+        n, sx, sy, sxx, sxy = sums
+        spread = n * sxx - sx * sx
+        if n >= 2 and spread > 1e-9 * n * n:
+            per_mp = (n * sxy - sx * sy) / spread
+            fixed = (sy - per_mp * sx) / n
+            if per_mp >= 0 and fixed >= 0:
+                return fixed, per_mp
+        # Too few or too similar samples for a line: scale the mean rate
+        if sx > 0:
+            return 0.0, sy / sx
+        return sy / n, 0.0
+    
+    def predict(self, stage, megapixels, count=1):
+        """Predicted seconds for count images totalling the given megapixels"""
+        fixed, per_mp = self.coefficients(stage)
+        return fixed * count + per_mp * megapixels
+    
+    def snapshot(self):
+        """Current per-stage rates, for stats"""
+        return {stage: round(self.predict(stage, 1.0), 4) for stage in sorted(self.sums)}
+
+# Shared across jobs so later jobs start from calibrated rates
+COST_MODEL = CostModel(PLAN_SECONDS_PER_MEGAPIXEL)
+
+class ProgressEstimator:
+    """Throughput and ETA for a job from the cost model's predictions of the remaining files"""
+    
+    def __init__(self, items):
+        # items: {key: (stage, megapixels)}; per-stage [count, megapixels] totals
+        # keep each snapshot O(stages) rather than O(files)
+        self.items = dict(items)
+        self.remaining = {}
+        self.done = {}
+        for stage, megapixels in self.items.values():
+            totals = self.remaining.setdefault(stage, [0, 0.0])
+            totals[0] += 1
+            totals[1] += megapixels
+        self.done_count = 0
+        self.done_mp = 0.0
+        self.started = time.monotonic()
+    
+    def complete(self, key, seconds=None):
+        stage, megapixels = self.items.pop(key)
+        if seconds is not None:
+            COST_MODEL.observe(stage, megapixels, seconds)
+        self.remaining[stage][0] -= 1
+        self.remaining[stage][1] -= megapixels
+        totals = self.done.setdefault(stage, [0, 0.0])
+        totals[0] += 1
+        totals[1] += megapixels
+        self.done_count += 1
+        self.done_mp += megapixels
+    
+    def snapshot(self):
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        done_cost = sum(COST_MODEL.predict(stage, mp, count) for stage, (count, mp) in self.done.items())
+        remaining_cost = sum(COST_MODEL.predict(stage, max(mp, 0.0), count)
+                             for stage, (count, mp) in self.remaining.items() if count)
+        # Predicted work finished per wall second captures parallelism and overhead
+        rate = done_cost / elapsed if done_cost > 0 else None
+        return {
+            'eta': round(remaining_cost / rate, 1) if rate else None,
+            'images_per_sec': round(self.done_count / elapsed, 2),
+            'mp_per_sec': round(self.done_mp / elapsed, 2),
+        }
+
+def timed_convert_file(*args):
+    """convert_file() plus its wall time, for the cost model"""
+    start = time.perf_counter()
+    success = convert_file(*args)
+    return success, time.perf_counter() - start
+
+def output_channels(mode):
+    """Channels ImageMagick/Pillow write to PNG for a source mode"""
+    if mode in ('1', 'L', 'I', 'I;16', 'F'):
+        return 1
+    if mode == 'LA':
+        return 2
+    if mode in ('RGBA', 'PA'):
+        return 4
+    return 3
+
+def smart_crop_box(path, target_width, target_height, frame=None, proxy_size=512):
+    """Approximate smartcrop box from a downscaled proxy, in source pixel coordinates"""
+    from PIL import Image
+    import smartcrop
+    
+    info = probe_image(path)
+    if is_large(info):
+        width, height = info['width'], info['height']
+        ratio = max(width, height) / proxy_size
+        proxy = stream_downsample(path, frame, (0, 0, width, height),
+                                  (max(1, round(width / ratio)), max(1, round(height / ratio))))
+    else:
+        with Image.open(path) as img:
+            if frame:
+                img.seek(frame)
+            width, height = img.size
+            # draft() lets JPEG decode at 1/2, 1/4 or 1/8 scale
+            img.draft('RGB', (proxy_size, proxy_size))
+            proxy = img.convert('RGB')
+        proxy.thumbnail((proxy_size, proxy_size))
+    scale = width / proxy.width
+    
+    box = smartcrop.SmartCrop().crop(proxy, target_width, target_height)['top_crop']
+    x, y = round(box['x'] * scale), round(box['y'] * scale)
+    return (x, y, min(width - x, round(box['width'] * scale)), min(height - y, round(box['height'] * scale)))
+
+def build_plan(directory, files, options):
+    """Predict the full job from header probes: names, output sizes, crop boxes and cost"""
+    resize_size = int(options['resize_size']) if options['resize_size'] else None
+    number = 1
+    existing = 0
+    if options['append']:
+        out_root = os.path.abspath(options['output_dir']) if options['output_dir'] else directory
+        number = next_sequence_number(out_root, options['prefix'])
+        if os.path.realpath(out_root) == os.path.realpath(directory):
+            kept = [f for f in files if sequence_number(options['prefix'], f) is None]
+            existing = len(files) - len(kept)
+            files = kept
+    rejected = {}
+    if options['prefilter']:
+        rejected = prefilter_files(directory, files, resize_size, options['prefilter'])
+        files = [f for f in files if f not in rejected]
+    
+    assignments = {}
+    if options['bucket']:
+        _, assignments, _ = assign_buckets(directory, files, resize_size, options['buckets'])
+    
+    entries = []
+    for filename in files:
+        path = os.path.join(directory, filename)
+        entry = {'source': filename}
+        try:
+            info = probe_image(path)
+        except Exception as e:
+            entry['error'] = f'Unreadable: {e}'
+            entries.append(entry)
+            continue
+        
+        frame = min(options['frame'], info['frames'] - 1) if info['frames'] > 1 else None
+        target = assignments.get(filename, resize_size) if resize_size else None
+        if target:
+            out_width, out_height = target_dimensions(target)
+            if options['crop_mode'] == 'smart':
+                box = None
+                if options['smart_boxes']:
+                    cached = CROP_CACHE.get(file_digest(path), crop_aspect_key(out_width, out_height),
+                                            smartcrop_params_key(frame))
+                    if cached is not None:
+                        box = clamp_box(cached[0], info['width'], info['height'])
+                    else:
+                        box = smart_crop_box(path, out_width, out_height, frame)
+            else:
+                box = center_crop_box(info['width'], info['height'], out_width, out_height)
+        else:
+            out_width, out_height, box = info['width'], info['height'], None
+        stage = task_stage(target, options['crop_mode'], options['quality'])
+        passthrough = not options['reencode'] and is_conforming(info, target)
+        
+        megapixels = info['width'] * info['height'] / 1e6
+        entry.update({
+            'name': sequence_name(options['prefix'], number),
+            'width': info['width'],
+            'height': info['height'],
+            'format': info['format'],
+            'frames': info['frames'],
+            'frame': frame,
+            'output_width': out_width,
+            'output_height': out_height,
+            'crop': None if passthrough or not box else dict(zip(('x', 'y', 'width', 'height'), box)),
+            'passthrough': passthrough,
+            'estimated_bytes': os.path.getsize(path) if passthrough else
+                int(out_width * out_height * output_channels(info['mode']) * PLAN_PNG_RATIO),
+            'estimated_seconds': 0 if passthrough else round(COST_MODEL.predict(stage, megapixels), 4),
+            'estimated_memory': 0 if passthrough else estimate_task_memory(info, target, options['crop_mode']),
+        })
+        entries.append(entry)
+        number += 1
+    
+    planned = [e for e in entries if 'error' not in e]
+    return {
+        'entries': entries,
+        'rejected': rejected,
+        'totals': {
+            'files': len(planned),
+            'errors': len(entries) - len(planned),
+            'passthrough': sum(1 for e in planned if e['passthrough']),
+            'existing': existing,
+            'prefiltered': len(rejected),
+            'estimated_bytes': sum(e['estimated_bytes'] for e in planned),
+            # Workers share the load; memory admission can serialize huge images
+            'estimated_seconds': round(sum(e['estimated_seconds'] for e in planned) / options['workers'], 2),
+        }
+    }
+
+@app.route('/plan', methods=['POST'])
+def plan_job():
+    """Dry run: what /process would do, computed from header probes without decoding"""
+    data = request.json
+    directory = data.get('directory', os.getcwd())
+    if is_archive(directory):
+        return jsonify({'success': False, 'error': 'Dry runs are only available for directory sources'})
+    if not os.path.isdir(directory):
+        return jsonify({'success': False, 'error': 'Invalid directory path'})
+    
+    try:
+        files = data.get('files') or list_images(directory)
+        options = job_options(data)
+        if options['output_dir']:
+            conflict = output_conflict(os.path.abspath(directory), os.path.abspath(options['output_dir']),
+                                       options['prefix'], options['append'])
+            if conflict:
+                return jsonify({'success': False, 'error': conflict})
+        plan = build_plan(os.path.abspath(directory), files, options)
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+    return jsonify({'success': True, **plan})
+
 @app.route('/process', methods=['POST'])
 def process_images():
     data = request.json
     directory = data.get('directory', os.getcwd())
-    prefix = data.get('prefix', '')
     selected_files = data.get('files', [])
-    resize_size = data.get('resize_size', '')
-    crop_mode = data.get('crop_mode', 'center')
+    options = job_options(data)
+    prefix = options['prefix']
+    resize_size = options['resize_size']
+    crop_mode = options['crop_mode']
+    bucket_mode = options['bucket']
+    bucket_spec = options['buckets']
+    workers = options['workers']
+    memory_budget = options['memory_budget']
+    frame_index = options['frame']
+    quality = options['quality']
+    reencode = options['reencode']
+    output_dir = options['output_dir']
+    append = options['append']
+    
+    if is_archive(directory):
+        return app.response_class(process_archive(directory, selected_files, options), mimetype='text/event-stream')
     
     def generate():
         if not os.path.isdir(directory):
@@ -1089,97 +2180,947 @@ def process_images():
             return
         
         try:
-            os.chdir(directory)
+            # Work with absolute paths; conversions run on worker threads and
+            # concurrent requests must not depend on the process-wide cwd
+            root = os.path.abspath(directory)
+            # Results go to out_root; originals are only deleted when it is the source
+            out_root = os.path.abspath(output_dir) if output_dir else root
+            in_place = os.path.realpath(out_root) == os.path.realpath(root)
+            if not in_place:
+                conflict = output_conflict(root, out_root, prefix, append)
+                if conflict:
+                    yield f"data: {json.dumps({'error': conflict})}\n\n"
+                    return
+                os.makedirs(out_root, exist_ok=True)
             
-            # Check ImageMagick
-            try:
-                subprocess.run(['magick', '--version'], capture_output=True, timeout=5)
-            except (subprocess.TimeoutExpired, FileNotFoundError):
+            # Check ImageMagick (detected once, not per job)
+            if not get_capabilities()['magick']:
                 yield f"data: {json.dumps({'error': 'ImageMagick not found'})}\n\n"
                 return
             
+            # Append: continue after the highest existing output (one directory
+            # pass) and leave files that already are outputs completely alone
+            job_files = selected_files
+            first_number = 1
+            if append:
+                first_number = next_sequence_number(out_root, prefix)
+                if in_place:
+                    job_files = [f for f in selected_files if sequence_number(prefix, f) is None]
+                yield f"data: {json.dumps({'log': f'Append mode: {len(selected_files) - len(job_files)} existing outputs left untouched, new files start at {sequence_name(prefix, first_number)}'})}\n\n"
+                if not job_files:
+                    yield f"data: {json.dumps({'complete': True, 'processed': 0, 'skipped': 0, 'output_dir': out_root, 'stats': {}})}\n\n"
+                    return
+            
+            # Quality prefilter: drop tiny, blank and heavily blurred images before any conversion
+            rejected = {}
+            if options['prefilter']:
+                yield f"data: {json.dumps({'log': '--- Quality prefilter ---'})}\n\n"
+                rejected = prefilter_files(root, job_files, resize_size, options['prefilter'])
+                for filename in job_files:
+                    verdict = rejected.get(filename)
+                    if verdict:
+                        message = f"✗ Skipped ({verdict['reject']}): {filename} - {verdict['detail']}"
+                        yield f"data: {json.dumps({'log': message})}\n\n"
+                job_files = [f for f in job_files if f not in rejected]
+                yield f"data: {json.dumps({'log': f'Prefilter: {len(rejected)} rejected, {len(job_files)} kept'})}\n\n"
+                yield f"data: {json.dumps({'log': ''})}\n\n"
+                if not job_files:
+                    yield f"data: {json.dumps({'complete': True, 'processed': 0, 'skipped': 0, 'output_dir': out_root, 'stats': {'prefiltered': len(rejected)}})}\n\n"
+                    return
+            
+            # Assign aspect-ratio buckets from header probes before any decoding
+            bucket_assignments = {}
+            if bucket_mode:
+                _, bucket_assignments, _ = assign_buckets(
+                    root, job_files, int(resize_size), bucket_spec)
+                counts = {}
+                for bucket in bucket_assignments.values():
+                    counts[bucket] = counts.get(bucket, 0) + 1
+                yield f"data: {json.dumps({'log': '--- Aspect-ratio buckets ---'})}\n\n"
+                for (w, h), count in sorted(counts.items(), key=lambda item: item[0][0] / item[0][1]):
+                    yield f"data: {json.dumps({'log': f'{w}x{h}: {count}'})}\n\n"
+            
             # Step 1: Convert (and optionally resize)
-            if resize_size:
+            if bucket_mode:
+                yield f"data: {json.dumps({'log': f'--- Converting and resizing to buckets within {resize_size}x{resize_size} pixels ---'})}\n\n"
+            elif resize_size:
                 yield f"data: {json.dumps({'log': f'--- Converting and resizing to {resize_size}x{resize_size} ---'})}\n\n"
             else:
                 yield f"data: {json.dumps({'log': '--- Converting to PNG format ---'})}\n\n"
             
-            i = 1
-            temp_files = []
-            total = len(selected_files)
-            
-            for idx, filename in enumerate(selected_files):
-                file_path = Path(filename)
-                if not file_path.exists():
+            # Probe every file up front so the scheduler can budget its memory
+            tasks = []
+            work = {}
+            # Conforming files skip the converter and are moved into place as-is
+            passthrough = {}
+            order = []
+            for idx, filename in enumerate(job_files):
+                file_path = os.path.join(root, filename)
+                if not os.path.isfile(file_path):
                     yield f"data: {json.dumps({'log': f'✗ File not found: {filename}'})}\n\n"
                     continue
                 
-                temp_name = f"temp_{i:04d}.png"
-                
-                # Update progress
-                yield f"data: {json.dumps({'progress': True, 'current': idx + 1, 'total': total, 'message': f'Processing {filename}'})}\n\n"
-                
+                target = bucket_assignments.get(filename, int(resize_size)) if resize_size else None
+                temp_path = os.path.join(out_root, f"temp_{idx + 1:04d}.png")
+                order.append(file_path)
+                frame = None
                 try:
-                    if resize_size:
-                        if crop_mode == 'smart':
-                            success = resize_smart_crop(str(file_path), temp_name, int(resize_size))
-                        else:
-                            success = resize_center_crop(str(file_path), temp_name, int(resize_size))
-                    else:
-                        result = subprocess.run(
-                            ['magick', str(file_path), temp_name],
-                            capture_output=True, text=True, timeout=30
-                        )
-                        success = result.returncode == 0
-                    
-                    if success:
-                        yield f"data: {json.dumps({'log': f'✓ Processed: {filename}'})}\n\n"
-                        temp_files.append((filename, temp_name))
-                        i += 1
-                    else:
-                        yield f"data: {json.dumps({'log': f'✗ Failed: {filename}'})}\n\n"
-                except Exception as e:
-                    yield f"data: {json.dumps({'log': f'✗ Error: {filename} - {str(e)}'})}\n\n"
+                    info = probe_image(file_path)
+                    if not reencode and is_conforming(info, target):
+                        passthrough[file_path] = temp_path
+                        continue
+                    cost = estimate_task_memory(info, target, crop_mode)
+                    megapixels = info['width'] * info['height'] / 1e6
+                    frames = info['frames']
+                    if frames > 1:
+                        frame = min(frame_index, frames - 1)
+                        yield f"data: {json.dumps({'log': f'Multi-frame: {filename} ({frames} frames, using frame {frame})'})}\n\n"
+                except Exception:
+                    # Unreadable header - assume a generous decode ratio
+                    cost = os.path.getsize(file_path) * 10
+                    megapixels = os.path.getsize(file_path) / 1e6
+                tasks.append((cost, (file_path, temp_path, target, crop_mode, frame, quality),
+                              task_deadline(megapixels)))
+                work[file_path] = (task_stage(target, crop_mode, quality), megapixels)
             
-            # Step 2: Remove originals
-            yield f"data: {json.dumps({'log': ''})}\n\n"
-            yield f"data: {json.dumps({'log': '--- Removing original files ---'})}\n\n"
+            if passthrough:
+                yield f"data: {json.dumps({'log': f'Already conforming PNGs, not re-encoded: {len(passthrough)}'})}\n\n"
             
-            for idx, (original_file, temp_file) in enumerate(temp_files):
-                yield f"data: {json.dumps({'progress': True, 'current': idx + 1, 'total': len(temp_files), 'message': 'Removing originals'})}\n\n"
-                try:
-                    Path(original_file).unlink()
-                    yield f"data: {json.dumps({'log': f'✓ Removed: {original_file}'})}\n\n"
-                except Exception:
-                    yield f"data: {json.dumps({'log': f'✗ Failed to remove: {original_file}'})}\n\n"
+            scheduler = MemoryBudgetScheduler(memory_budget, workers)
+            estimator = ProgressEstimator(work)
+            converted = dict(passthrough)
+            total = len(tasks)
+            
+            for done, (task, result, error) in enumerate(scheduler.run(tasks, timed_convert_file), 1):
+                file_path, temp_path = task[1][0], task[1][1]
+                filename = os.path.basename(file_path)
+                success, seconds = result if result else (False, None)
+                # Only successful runs are representative of the stage's cost
+                estimator.complete(file_path, seconds if success else None)
+                # time lets clients (and loadtest.py) measure event delivery lag
+                yield f"data: {json.dumps({'progress': True, 'current': done, 'total': total, 'message': f'Processed {filename}', 'time': time.time(), **estimator.snapshot()})}\n\n"
+                
+                if error is not None:
+                    yield f"data: {json.dumps({'log': f'✗ Error: {filename} - {str(error)}'})}\n\n"
+                elif success:
+                    yield f"data: {json.dumps({'log': f'✓ Processed: {filename}'})}\n\n"
+                    converted[file_path] = temp_path
+                else:
+                    yield f"data: {json.dumps({'log': f'✗ Failed: {filename}'})}\n\n"
+            
+            # Keep the selection order for numbering regardless of completion order
+            temp_files = [(file_path, converted[file_path]) for file_path in order if file_path in converted]
+            stats = scheduler.stats()
+            stats['skipped_reencode'] = len(passthrough)
+            stats['prefiltered'] = len(rejected)
+            throughput = estimator.snapshot()
+            stats['images_per_sec'] = throughput['images_per_sec']
+            stats['mp_per_sec'] = throughput['mp_per_sec']
+            stats['seconds_per_megapixel'] = COST_MODEL.snapshot()
+            
+            # Step 2: Remove originals, or leave them alone and link unchanged files
+            yield f"data: {json.dumps({'log': ''})}\n\n"
+            if not in_place:
+                yield f"data: {json.dumps({'log': f'--- Keeping originals, writing to {out_root} ---'})}\n\n"
+                placed = {}
+                for original_file, temp_file in temp_files:
+                    if original_file not in passthrough:
+                        continue
+                    original_name = os.path.basename(original_file)
+                    try:
+                        method = place_file(original_file, temp_file)
+                        placed[method] = placed.get(method, 0) + 1
+                        yield f"data: {json.dumps({'log': f'✓ Kept as-is ({method}): {original_name}'})}\n\n"
+                    except Exception:
+                        yield f"data: {json.dumps({'log': f'✗ Failed to place: {original_name}'})}\n\n"
+                stats['placed'] = placed
+            else:
+                yield f"data: {json.dumps({'log': '--- Removing original files ---'})}\n\n"
+                for idx, (original_file, temp_file) in enumerate(temp_files):
+                    yield f"data: {json.dumps({'progress': True, 'current': idx + 1, 'total': len(temp_files), 'message': 'Removing originals'})}\n\n"
+                    original_name = os.path.basename(original_file)
+                    if original_file in passthrough:
+                        # Moved aside rather than removed so renaming cannot collide with it
+                        try:
+                            Path(original_file).rename(temp_file)
+                            yield f"data: {json.dumps({'log': f'✓ Kept as-is: {original_name}'})}\n\n"
+                        except Exception:
+                            yield f"data: {json.dumps({'log': f'✗ Failed to move: {original_name}'})}\n\n"
+                        continue
+                    try:
+                        Path(original_file).unlink()
+                        yield f"data: {json.dumps({'log': f'✓ Removed: {original_name}'})}\n\n"
+                    except Exception:
+                        yield f"data: {json.dumps({'log': f'✗ Failed to remove: {original_name}'})}\n\n"
             
             # Step 3: Rename
             yield f"data: {json.dumps({'log': ''})}\n\n"
             yield f"data: {json.dumps({'log': '--- Renaming to sequential numbers ---'})}\n\n"
             
-            i = 1
+            i = first_number
             for idx, (original_file, temp_file) in enumerate(temp_files):
-                new_name = f"{prefix}-{i}.png" if prefix else f"{i}.png"
+                # Appending or writing elsewhere never overwrites, even if outputs appeared meanwhile
+                while (append or not in_place) and os.path.exists(os.path.join(out_root, sequence_name(prefix, i))):
+                    i += 1
+                new_name = sequence_name(prefix, i)
+                temp_name = os.path.basename(temp_file)
                 
                 yield f"data: {json.dumps({'progress': True, 'current': idx + 1, 'total': len(temp_files), 'message': 'Renaming files'})}\n\n"
                 
                 try:
-                    Path(temp_file).rename(new_name)
-                    yield f"data: {json.dumps({'log': f'✓ {temp_file} -> {new_name}'})}\n\n"
+                    Path(temp_file).rename(os.path.join(out_root, new_name))
+                    yield f"data: {json.dumps({'log': f'✓ {temp_name} -> {new_name}'})}\n\n"
                     i += 1
                 except Exception:
-                    yield f"data: {json.dumps({'log': f'✗ Failed: {temp_file}'})}\n\n"
+                    yield f"data: {json.dumps({'log': f'✗ Failed: {temp_name}'})}\n\n"
             
-            yield f"data: {json.dumps({'complete': True, 'processed': len(temp_files)})}\n\n"
+            yield f"data: {json.dumps({'complete': True, 'processed': len(temp_files), 'skipped': len(passthrough), 'output_dir': out_root, 'stats': stats})}\n\n"
             
         except Exception as e:
             yield f"data: {json.dumps({'error': str(e)})}\n\n"
     
     return app.response_class(generate(), mimetype='text/event-stream')
 
+def probe_bytes(data):
+    """probe_image for encoded bytes held in memory"""
+    from PIL import Image
+    
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            return header_info(img)
+    except Image.DecompressionBombError:
+        return ping_image(None, data)
+
+def convert_bytes(data, info, target, crop_mode, frame=None, quality='best'):
+    """In-memory convert_file: encoded image bytes in, PNG bytes out (None on failure)"""
+    if target and is_large(info):
+        # The streamed path reads rows from a file; only the encoded bytes
+        # and the output-sized result are ever in memory
+        with tempfile.TemporaryDirectory(prefix='magicrenamer-') as scratch:
+            source, output = os.path.join(scratch, 'source'), os.path.join(scratch, 'output.png')
+            with open(source, 'wb') as f:
+                f.write(data)
+            if not resize_streamed(source, output, target, crop_mode, info, frame, quality):
+                return None
+            with open(output, 'rb') as f:
+                return f.read()
+    
+    source = frame_source('-', frame)
+    args = []
+    if target:
+        target_width, target_height = target_dimensions(target)
+        if crop_mode == 'smart':
+            try:
+                from PIL import Image
+                
+                img = Image.open(io.BytesIO(data))
+                if frame:
+                    img.seek(frame)
+                if img.mode != 'RGB':
+                    img = img.convert('RGB')
+                digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+                x, y, width, height = smart_crop_region(img, digest, target_width, target_height, frame)
+                final = pil_resize(img.crop((x, y, x + width, y + height)), (target_width, target_height), quality)
+                out = io.BytesIO()
+                final.save(out, 'PNG', optimize=True)
+                return out.getvalue()
+            except Exception:
+                # Fall back to a center crop, as resize_smart_crop does
+                pass
+        x, y, crop_width, crop_height = center_crop_box(info['width'], info['height'], target_width, target_height)
+        args = ['-crop', f'{crop_width}x{crop_height}+{x}+{y}', '+repage',
+                *magick_resize_args(target_width, target_height, quality)]
+    
+    # ImageMagick reads the upload from stdin and writes the PNG to stdout
+    result = subprocess.run(['magick', source, *args, 'png:-'], input=data, capture_output=True, timeout=30)
+    return result.stdout if result.returncode == 0 and result.stdout else None
+
+def convert_stream(parts, options, write, manifest, total=None, first_number=1, taken=None):
+    """Convert (filename, data) pairs in memory, writing numbered PNGs in input order and yielding progress events"""
+    next_number = first_number
+    target = int(options['resize_size']) if options['resize_size'] else None
+    workers = options['workers']
+    # Conversions run in the supervised workers like /process; the header
+    # probe stays here so conforming files never make the round trip
+    executor = convert_pool(workers)
+    
+    def submit(data):
+        """(future of the PNG bytes, info, kept as-is) for one encoded image"""
+        info = probe_bytes(data)
+        if not options['reencode'] and is_conforming(info, target):
+            future = Future()
+            future.set_result(data)
+            return future, info, True
+        frame = min(options['frame'], info['frames'] - 1) if info['frames'] > 1 else None
+        # Same server-wide admission as /process; the encoded bytes are held
+        # here and again in the worker
+        cost = estimate_task_memory(info, target, options['crop_mode']) + 2 * len(data)
+        counts['oversized'] += cost > ADMISSION.budget
+        if not ADMISSION.try_acquire(cost):
+            counts['deferred'] += 1
+            while not ADMISSION.try_acquire(cost):
+                ADMISSION.wait(ADMISSION_POLL_SECONDS)
+        future = executor.submit(convert_bytes, data, info, target, options['crop_mode'], frame, options['quality'],
+                                 timeout=task_deadline(info['width'] * info['height'] / 1e6))
+        future.add_done_callback(lambda _: ADMISSION.release(cost))
+        return future, info, False
+    
+    counts = {'received': 0, 'processed': 0, 'skipped': 0, 'timeouts': 0, 'crashes': 0, 'recycles': 0,
+              'deferred': 0, 'oversized': 0}
+    megapixels = 0.0
+    started = time.perf_counter()
+    
+    def finish(future, filename, info, kept):
+        nonlocal megapixels, next_number
+        counts['recycles'] += getattr(future, 'recycled', False)
+        try:
+            png = future.result()
+            reason = 'conversion failed'
+        except Exception as e:
+            png, reason = None, str(e)
+            counts['timeouts'] += isinstance(e, TaskTimeout)
+            counts['crashes'] += isinstance(e, WorkerCrashed)
+        if png is None:
+            manifest['failed'].append(filename)
+            yield {'log': f'✗ Failed: {filename} - {reason}'}
+        else:
+            counts['processed'] += 1
+            counts['skipped'] += kept
+            # Names already taken at the destination are skipped, never overwritten
+            while taken and taken(sequence_name(options['prefix'], next_number)):
+                next_number += 1
+            name = sequence_name(options['prefix'], next_number)
+            next_number += 1
+            write(name, png)
+            manifest['files'][name] = filename
+            megapixels += info['width'] * info['height'] / 1e6
+            yield {'log': f"✓ {filename} -> {name}{' (kept as-is)' if kept else ''}"}
+        elapsed = time.perf_counter() - started
+        done = counts['processed'] + len(manifest['failed'])
+        rate = done / elapsed if elapsed else 0
+        yield {
+            'progress': True, 'current': done, 'total': total, 'message': f'Processed {filename}',
+            'images_per_sec': round(rate, 2), 'mp_per_sec': round(megapixels / elapsed, 2) if elapsed else 0,
+            'eta': round((total - done) / rate, 1) if total and rate else None,
+            'time': time.time(),
+        }
+    
+    # At most one encoded image per worker is held at a time, however many parts follow
+    pending = deque()
+    try:
+        for filename, data in parts:
+            counts['received'] += 1
+            try:
+                pending.append((*submit(data), filename))
+            except Exception as e:
+                # Unreadable header: nothing to send to a worker
+                failed = Future()
+                failed.set_exception(e)
+                pending.append((failed, None, False, filename))
+            while len(pending) >= workers:
+                future, info, kept, filename = pending.popleft()
+                yield from finish(future, filename, info, kept)
+        while pending:
+            future, info, kept, filename = pending.popleft()
+            yield from finish(future, filename, info, kept)
+    finally:
+        for future, *_ in pending:
+            future.cancel()
+    
+    elapsed = time.perf_counter() - started
+    yield {'complete': True, 'processed': counts['processed'], 'skipped': counts['skipped'], 'stats': {
+        'received': counts['received'],
+        'failed': len(manifest['failed']),
+        'skipped_reencode': counts['skipped'],
+        'deferred_admissions': counts['deferred'],
+        'oversized_tasks': counts['oversized'],
+        'task_timeouts': counts['timeouts'],
+        'worker_recycles': counts['recycles'],
+        'worker_crashes': counts['crashes'],
+        'images_per_sec': round(counts['processed'] / elapsed, 2) if elapsed else 0,
+        'mp_per_sec': round(megapixels / elapsed, 2) if elapsed else 0,
+    }}
+
+class OutputSink:
+    """Destination of a streamed job: a directory, or a new zip/tar(.gz) archive"""
+    
+    def __init__(self, path):
+        self.path = path
+        self.zip = self.tar = None
+        self.is_archive = path.lower().endswith(ARCHIVE_EXTENSIONS)
+    
+    def open(self):
+        """Create the destination; an existing archive is never replaced (FileExistsError)"""
+        lower = self.path.lower()
+        if self.is_archive:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            if lower.endswith('.zip'):
+                # PNG is already compressed; storing avoids deflating it again
+                self.zip = zipfile.ZipFile(self.path, 'x', zipfile.ZIP_STORED)
+            else:
+                self.tar = tarfile.open(self.path, 'x' if lower.endswith('.tar') else 'x:gz')
+        else:
+            os.makedirs(self.path, exist_ok=True)
+    
+    def taken(self, name):
+        return not self.is_archive and os.path.exists(os.path.join(self.path, name))
+    
+    def write(self, name, data):
+        if self.zip:
+            self.zip.writestr(name, data)
+        elif self.tar:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = int(time.time())
+            self.tar.addfile(info, io.BytesIO(data))
+        else:
+            with open(os.path.join(self.path, name), 'xb') as f:
+                f.write(data)
+    
+    def close(self):
+        if self.zip or self.tar:
+            (self.zip or self.tar).close()
+            self.zip = self.tar = None
+
+def process_archive(path, members, options):
+    """/process for an archive source: members are decoded in memory and the archive is never modified"""
+    if not members:
+        yield f"data: {json.dumps({'error': 'No files selected'})}\n\n"
+        return
+    if not options['output_dir']:
+        yield f"data: {json.dumps({'error': 'Set an output directory (or a .zip/.tar path) for archive sources'})}\n\n"
+        return
+    if not get_capabilities()['magick']:
+        yield f"data: {json.dumps({'error': 'ImageMagick not found'})}\n\n"
+        return
+    
+    out = OutputSink(os.path.abspath(options['output_dir']))
+    prefix = options['prefix']
+    first_number = 1
+    if os.path.exists(out.path) and os.path.realpath(out.path) == os.path.realpath(path):
+        yield f"data: {json.dumps({'error': 'The output would overwrite the source archive'})}\n\n"
+        return
+    if out.is_archive:
+        if os.path.exists(out.path):
+            yield f"data: {json.dumps({'error': f'{out.path} already exists; choose a new archive name'})}\n\n"
+            return
+    elif options['append']:
+        first_number = next_sequence_number(out.path, prefix)
+    else:
+        conflict = output_conflict(path, out.path, prefix, False)
+        if conflict:
+            yield f"data: {json.dumps({'error': conflict})}\n\n"
+            return
+    
+    manifest = {'files': {}, 'failed': []}
+    try:
+        with ArchiveSource(path) as archive:
+            out.open()
+            yield f"data: {json.dumps({'log': f'--- Converting {len(members)} images from {os.path.basename(path)} into {out.path} ---'})}\n\n"
+            for event in convert_stream(archive.iter_members(members), options, out.write, manifest, len(members),
+                                        first_number, out.taken):
+                if event.get('complete'):
+                    # Finish the output archive before reporting completion
+                    out.close()
+                    event['output_dir'] = out.path
+                yield f"data: {json.dumps(event)}\n\n"
+    except FileExistsError as e:
+        yield f"data: {json.dumps({'error': f'Refusing to overwrite {e.filename}'})}\n\n"
+    except Exception as e:
+        yield f"data: {json.dumps({'error': str(e)})}\n\n"
+    finally:
+        out.close()
+
+def iter_multipart(stream, boundary, max_part_size, chunk_size=64 * 1024):
+    """Yield (name, filename, data) for each part of a multipart body as soon as it has arrived"""
+    from werkzeug.sansio.multipart import MultipartDecoder, Field, File, Data, Epilogue, NeedData
+    
+    decoder = MultipartDecoder(boundary.encode())
+    part = None
+    buffer = bytearray()
+    ended = False
+    while True:
+        event = decoder.next_event()
+        if isinstance(event, NeedData):
+            if ended:
+                raise ValueError('Upload ended in the middle of a part')
+            chunk = stream.read(chunk_size)
+            ended = not chunk
+            decoder.receive_data(chunk or None)
+        elif isinstance(event, (Field, File)):
+            part = event
+            buffer = bytearray()
+        elif isinstance(event, Data):
+            buffer += event.data
+            if len(buffer) > max_part_size:
+                raise ValueError(f'Part {part.name!r} is larger than {max_part_size // 1024 ** 2} MB')
+            if not event.more_data:
+                yield part.name, getattr(part, 'filename', None), bytes(buffer)
+                buffer = bytearray()
+        elif isinstance(event, Epilogue):
+            return
+
+class ZipStream(io.RawIOBase):
+    """Write-only sink for zipfile whose output is drained chunk by chunk into a response"""
+    
+    def __init__(self):
+        self.chunks = []
+    
+    def writable(self):
+        return True
+    
+    def write(self, data):
+        # Not seekable, so zipfile writes data descriptors instead of seeking back
+        self.chunks.append(bytes(data))
+        return len(data)
+    
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+class JobChannel:
+    """Recent progress events of a job, followed over SSE from a separate request"""
+    
+    def __init__(self, limit=1000):
+        self.events = deque(maxlen=limit)
+        self.published = 0
+        self.closed_at = None
+        self.condition = threading.Condition()
+    
+    def publish(self, event):
+        with self.condition:
+            self.events.append(event)
+            self.published += 1
+            self.condition.notify_all()
+    
+    def close(self):
+        with self.condition:
+            self.closed_at = time.time()
+            self.condition.notify_all()
+    
+    def follow(self, keepalive=15):
+        """Yield buffered then live events until the job ends (None on idle timeouts)"""
+        seen = 0
+        while True:
+            with self.condition:
+                if seen == self.published and self.closed_at is None:
+                    self.condition.wait(keepalive)
+                oldest = self.published - len(self.events)
+                batch = list(self.events)[max(seen, oldest) - oldest:]
+                seen = self.published
+                closed = self.closed_at is not None
+            for event in batch:
+                yield event
+            if closed and seen == self.published:
+                return
+            if not batch:
+                yield None
+
+JOBS = {}
+_jobs_lock = threading.Lock()
+
+def open_job(job_id):
+    """Register a progress channel for a new upload job, dropping long-finished ones"""
+    now = time.time()
+    with _jobs_lock:
+        for key in [k for k, job in JOBS.items()
+                    if job.closed_at is not None and now - job.closed_at > JOB_RETENTION_SECONDS]:
+            del JOBS[key]
+        if job_id in JOBS and JOBS[job_id].closed_at is None:
+            raise ValueError(f'Job {job_id} is already running')
+        JOBS[job_id] = JobChannel()
+        return JOBS[job_id]
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    """SSE progress of an /upload job, in the same format as /process"""
+    with _jobs_lock:
+        channel = JOBS.get(job_id)
+    if channel is None:
+        abort(404)
+    
+    def generate():
+        for event in channel.follow():
+            if event is None:
+                yield ': keepalive\n\n'
+            else:
+                yield f"data: {json.dumps(event)}\n\n"
+    
+    return app.response_class(generate(), mimetype='text/event-stream')
+
+@app.route('/upload', methods=['POST'])
+def upload_images():
+    """Process uploaded images in memory and stream the renamed PNGs back as a ZIP"""
+    from werkzeug.http import parse_options_header
+    
+    mimetype, params = parse_options_header(request.content_type or '')
+    if mimetype != 'multipart/form-data' or 'boundary' not in params:
+        return jsonify({'success': False, 'error': 'Expected a multipart/form-data upload'}), 400
+    if not get_capabilities()['magick']:
+        return jsonify({'success': False, 'error': 'ImageMagick not found'}), 503
+    
+    job_id = request.args.get('job') or uuid.uuid4().hex
+    try:
+        channel = open_job(job_id)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 409
+    
+    # Job parameters come from the query string and from form fields sent before the first file
+    fields = request.args.to_dict()
+    total = int(fields['count']) if fields.get('count', '').isdigit() else None
+    stream = request.stream
+    boundary = params['boundary']
+    
+    def generate():
+        sink = ZipStream()
+        archive = zipfile.ZipFile(sink, 'w', zipfile.ZIP_STORED)
+        manifest = {'job': job_id, 'files': {}, 'failed': []}
+        try:
+            parts = iter_multipart(stream, boundary, UPLOAD_MAX_IMAGE_MB * 1024 ** 2)
+            first = []
+            for name, filename, data in parts:
+                if filename is None:
+                    fields[name] = data.decode('utf-8', 'replace')
+                    continue
+                first.append((filename, data))
+                break
+            files = itertools.chain(first, ((f, d) for _, f, d in parts if f is not None))
+            
+            channel.publish({'log': f'--- Upload job {job_id}: converting as files arrive ---'})
+            for event in convert_stream(files, job_options(fields), archive.writestr, manifest, total):
+                if event.get('complete'):
+                    archive.writestr('manifest.json', json.dumps(manifest, indent=2))
+                    archive.close()
+                channel.publish(event)
+                yield sink.drain()
+        except Exception as e:
+            # Headers are gone already; the truncated archive and the event tell the client
+            channel.publish({'error': str(e)})
+        finally:
+            channel.close()
+    
+    response = app.response_class(generate(), mimetype='application/zip')
+    response.headers['X-Job-Id'] = job_id
+    response.headers['Content-Disposition'] = f'attachment; filename="magicrenamer-{job_id}.zip"'
+    return response
+
+# Watch mode: a file is converted once its size and mtime have been stable for
+# WATCH_DEBOUNCE_SECONDS and it passes the integrity check. After
+# WATCH_GIVE_UP_SECONDS one that still looks truncated is converted anyway, and an
+# empty, unrecognised or unreadable one is recorded as failed
+WATCH_DEBOUNCE_SECONDS = 2.0
+WATCH_POLL_SECONDS = 1.0
+WATCH_RESCAN_SECONDS = 30.0
+WATCH_GIVE_UP_SECONDS = 60.0
+WATCH_LEDGER = '.magicrenamer-watch.jsonl'
+
+class InotifyWatch:
+    """Minimal ctypes inotify binding reporting names created, written or moved into a directory"""
+    
+    IN_MODIFY = 0x002
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    
+    def __init__(self, directory):
+        import ctypes
+        import ctypes.util
+        
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        # IN_NONBLOCK and IN_CLOEXEC share their values with O_NONBLOCK and O_CLOEXEC
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        mask = self.IN_MODIFY | self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, 'inotify_add_watch failed')
+    
+    def read(self, timeout):
+        """Names with activity, waiting up to timeout seconds for the first event"""
+        import select
+        import struct
+        
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        names = []
+        offset = 0
+        while offset < len(data):
+            _, _, _, length = struct.unpack_from('iIII', data, offset)
+            name = data[offset + 16:offset + 16 + length].rstrip(b'\0')
+            offset += 16 + length
+            if name:
+                names.append(os.fsdecode(name))
+        return names
+    
+    def close(self):
+        os.close(self.fd)
+
+class FolderWatcher:
+    """Converts images as they land in a directory, continuing the existing numbering"""
+    
+    def __init__(self, directory, options, debounce=WATCH_DEBOUNCE_SECONDS, use_inotify=True, log=print):
+        self.root = os.path.abspath(directory)
+        self.options = options
+        self.out_root = os.path.abspath(options['output_dir']) if options['output_dir'] else self.root
+        self.in_place = os.path.realpath(self.out_root) == os.path.realpath(self.root)
+        self.debounce = debounce
+        self.log = log
+        os.makedirs(self.out_root, exist_ok=True)
+        
+        self.watch = None
+        if use_inotify:
+            try:
+                self.watch = InotifyWatch(self.root)
+            except (OSError, AttributeError):
+                # No inotify (not Linux, or out of watches): fall back to polling
+                self.watch = None
+        
+        resize_size = int(options['resize_size']) if options['resize_size'] else None
+        self.resize_size = resize_size
+        self.buckets = None
+        if options['bucket'] and resize_size:
+            self.buckets = (parse_buckets(options['buckets'], resize_size) if options['buckets']
+                            else generate_buckets(resize_size))
+        
+        # The ledger records every source handled (converted or given up on) by
+        # name, size and mtime, so restarts and failures never repeat work
+        self.ledger_path = os.path.join(self.out_root, WATCH_LEDGER)
+        self.handled = {}
+        if os.path.exists(self.ledger_path):
+            with open(self.ledger_path) as f:
+                for line in f:
+                    entry = json.loads(line)
+                    self.handled[entry['source']] = (entry['size'], entry['mtime_ns'])
+        
+        self.next_number = next_sequence_number(self.out_root, options['prefix'])
+        self.pending = {}
+        self.in_flight = set()
+        self.temp_counter = 0
+        self.pool = None
+        self.lock = threading.Lock()
+    
+    def is_candidate(self, name):
+        if name.startswith(('temp_', '.')) or not name.lower().endswith(tuple(IMAGE_EXTENSIONS)):
+            return False
+        # In place, our own outputs land next to the sources
+        if self.in_place and sequence_number(self.options['prefix'], name) is not None:
+            return False
+        return name not in self.in_flight
+    
+    def touch(self, name, now):
+        """Note activity on a file; the debounce clock restarts whenever it changes"""
+        if not self.is_candidate(name):
+            return
+        try:
+            st = os.stat(os.path.join(self.root, name))
+        except FileNotFoundError:
+            self.pending.pop(name, None)
+            return
+        state = (st.st_size, st.st_mtime_ns)
+        if self.handled.get(name) == state:
+            return
+        previous = self.pending.get(name)
+        if previous is None or previous[:2] != state:
+            self.pending[name] = (*state, now, previous[3] if previous else now)
+    
+    def rescan(self, now):
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    self.touch(entry.name, now)
+    
+    def ready(self, now):
+        """Pending files that have settled and look complete"""
+        settled = []
+        for name, (size, mtime_ns, changed, first_seen) in list(self.pending.items()):
+            self.touch(name, now)
+            if name not in self.pending or self.pending[name][2] != changed or now - changed < self.debounce:
+                continue
+            problem = validate_image(os.path.join(self.root, name))
+            if problem and 'error' in problem:
+                if now - first_seen < WATCH_GIVE_UP_SECONDS:
+                    continue
+                if not problem.get('truncated'):
+                    # Empty, not an image or an unreadable header: nothing to convert
+                    self.record(name, size, mtime_ns, None, problem['error'])
+                    self.log(f'✗ Giving up on {name}: {problem["error"]}')
+                    del self.pending[name]
+                    continue
+                # A missing end marker is only a hint; the converter decides
+                self.log(f'{name}: {problem["error"]}, converting anyway')
+            del self.pending[name]
+            settled.append((name, size, mtime_ns))
+        return settled
+    
+    def record(self, name, size, mtime_ns, output, error=None):
+        self.handled[name] = (size, mtime_ns)
+        with open(self.ledger_path, 'a') as f:
+            f.write(json.dumps({'source': name, 'size': size, 'mtime_ns': mtime_ns,
+                                'output': output, 'error': error, 'time': time.time()}) + '\n')
+    
+    def claim_name(self):
+        """Next free sequence name, skipping numbers taken since the start-up scan"""
+        with self.lock:
+            while True:
+                name = sequence_name(self.options['prefix'], self.next_number)
+                self.next_number += 1
+                if not os.path.exists(os.path.join(self.out_root, name)):
+                    return name
+    
+    def convert(self, name, size, mtime_ns):
+        """Convert one settled file through the normal conversion path"""
+        started = time.perf_counter()
+        source = os.path.join(self.root, name)
+        options = self.options
+        with self.lock:
+            self.temp_counter += 1
+            temp_path = os.path.join(self.out_root, f'temp_watch_{self.temp_counter:06d}.png')
+        try:
+            info = probe_image(source)
+            target = None
+            if self.resize_size:
+                target = (nearest_bucket(info['width'], info['height'], self.buckets)
+                          if self.buckets else self.resize_size)
+            frame = min(options['frame'], info['frames'] - 1) if info['frames'] > 1 else None
+            kept = not options['reencode'] and is_conforming(info, target)
+            if kept:
+                output = self.claim_name()
+                if self.in_place:
+                    Path(source).rename(os.path.join(self.out_root, output))
+                else:
+                    place_file(source, os.path.join(self.out_root, output))
+            else:
+                conversion = self.pool.submit(convert_file, source, temp_path, target, options['crop_mode'],
+                                              frame, options['quality'],
+                                              timeout=task_deadline(info['width'] * info['height'] / 1e6))
+                if not conversion.result():
+                    raise RuntimeError('conversion failed')
+                output = self.claim_name()
+                Path(temp_path).rename(os.path.join(self.out_root, output))
+                if self.in_place:
+                    Path(source).unlink()
+            self.record(name, size, mtime_ns, output)
+            self.log(f"✓ {name} -> {output}{' (kept as-is)' if kept else ''} "
+                     f"in {time.perf_counter() - started:.2f}s")
+        except Exception as e:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            self.record(name, size, mtime_ns, None, str(e))
+            self.log(f'✗ Failed: {name} - {e}')
+        finally:
+            with self.lock:
+                self.in_flight.discard(name)
+    
+    def run(self, stop=None):
+        """Watch until stop (a threading.Event) is set or the process is interrupted"""
+        stop = stop or threading.Event()
+        mode = 'inotify' if self.watch else f'polling every {WATCH_POLL_SECONDS:g}s'
+        self.log(f'Watching {self.root} ({mode}), writing to {self.out_root}, '
+                 f'next number {self.next_number}')
+        last_scan = 0.0
+        # Threads handle the file bookkeeping; the conversions themselves go to
+        # supervised worker processes, since a daemon runs for days
+        with SupervisedPool(self.options['workers']) as self.pool, \
+                ThreadPoolExecutor(max_workers=self.options['workers']) as executor:
+            try:
+                while not stop.is_set():
+                    now = time.time()
+                    # Files already present at start-up, and any missed inotify event,
+                    # are picked up by the periodic rescan
+                    interval = WATCH_RESCAN_SECONDS if self.watch else WATCH_POLL_SECONDS
+                    if now - last_scan >= interval:
+                        self.rescan(now)
+                        last_scan = now
+                    for name, size, mtime_ns in self.ready(now):
+                        with self.lock:
+                            self.in_flight.add(name)
+                        executor.submit(self.convert, name, size, mtime_ns)
+                    
+                    wait_for = min(WATCH_POLL_SECONDS, self.debounce / 2) if self.pending else WATCH_POLL_SECONDS
+                    if self.watch:
+                        for name in self.watch.read(wait_for):
+                            self.touch(name, time.time())
+                    else:
+                        stop.wait(wait_for)
+            finally:
+                if self.watch:
+                    self.watch.close()
+        stats = self.pool.stats()
+        self.log(f"Stopped: {stats['task_timeouts']} timeouts, {stats['worker_recycles']} worker recycles, "
+                 f"{stats['worker_crashes']} worker crashes")
+
+def parse_args():
+    import argparse
+    parser = argparse.ArgumentParser(description='MagicRenamer web interface')
+    parser.add_argument('--host', default='0.0.0.0', help='address to listen on')
+    parser.add_argument('--port', type=int, default=5000, help='port to listen on')
+    parser.add_argument('--plan', metavar='DIR',
+                        help='print the dry-run plan for DIR as JSON and exit')
+    parser.add_argument('-n', '--prefix', default='', help='naming prefix')
+    parser.add_argument('-r', '--resize', default='', help='resize size (e.g. 512, 1024)')
+    parser.add_argument('-c', '--crop', default='center', choices=['center', 'smart'], help='crop mode')
+    parser.add_argument('--bucket', action='store_true', help='use aspect-ratio buckets')
+    parser.add_argument('-q', '--quality', default='best', choices=QUALITY_TIERS, help='resampling quality')
+    parser.add_argument('--frame', type=int, default=0, help='frame of multi-frame inputs to use')
+    parser.add_argument('--smart-boxes', action='store_true',
+                        help='also compute (approximate) smart crop boxes when planning')
+    parser.add_argument('--workers', type=int, default=CONVERT_WORKERS,
+                        help='concurrent conversions (also the most a web request may ask for)')
+    parser.add_argument('--append', action='store_true',
+                        help='plan: continue after existing prefix-N.png outputs instead of renumbering')
+    parser.add_argument('--watch', metavar='DIR',
+                        help='convert images as they arrive in DIR, continuing the numbering')
+    parser.add_argument('-o', '--output', metavar='DIR', help='write results to DIR instead of in place')
+    parser.add_argument('--debounce', type=float, default=WATCH_DEBOUNCE_SECONDS,
+                        help='seconds a new file must stay unchanged before it is converted')
+    parser.add_argument('--poll', action='store_true', help='poll instead of using inotify')
+    return parser.parse_args()
+
 if __name__ == '__main__':
+    args = parse_args()
+    CONVERT_WORKERS = max(1, args.workers)
+    
+    if args.plan:
+        directory = os.path.abspath(os.path.expanduser(args.plan))
+        if not os.path.isdir(directory):
+            raise SystemExit(f'Invalid directory path: {directory}')
+        options = job_options({'prefix': args.prefix, 'resize_size': args.resize, 'crop_mode': args.crop,
+                               'bucket': args.bucket, 'frame': args.frame, 'quality': args.quality,
+                               'smart_boxes': args.smart_boxes, 'workers': args.workers,
+                               'output_dir': args.output, 'append': args.append})
+        print(json.dumps(build_plan(directory, list_images(directory), options), indent=2))
+        raise SystemExit(0)
+    
+    if args.watch:
+        directory = os.path.abspath(os.path.expanduser(args.watch))
+        if not os.path.isdir(directory):
+            raise SystemExit(f'Invalid directory path: {directory}')
+        if not get_capabilities()['magick']:
+            raise SystemExit('ImageMagick not found')
+        options = job_options({'prefix': args.prefix, 'resize_size': args.resize, 'crop_mode': args.crop,
+                               'bucket': args.bucket, 'frame': args.frame, 'quality': args.quality,
+                               'workers': args.workers, 'output_dir': args.output})
+        watcher = FolderWatcher(directory, options, debounce=args.debounce, use_inotify=not args.poll,
+                                log=lambda message: print(message, flush=True))
+        try:
+            watcher.run()
+        except KeyboardInterrupt:
+            pass
+        raise SystemExit(0)
+    
     print("✨ MagicRenamer Web Interface")
     print(f"Version: {VERSION}")
-    print("\n🌐 Starting server at http://localhost:5000")
+    print(f"\n🌐 Starting server at http://localhost:{args.port}")
     print("Press Ctrl+C to stop\n")
-    app.run(host='0.0.0.0', port=5000, debug=False)
+    # Warm the capability cache in the background so the first job doesn't wait
+    threading.Thread(target=get_capabilities, daemon=True).start()
+    # Likewise start the conversion workers' fork server
+    threading.Thread(target=lambda: convert_pool().submit(os.getpid), daemon=True).start()
+    app.run(host=args.host, port=args.port, debug=False)
@@ -0,0 +1,648 @@
+// MagicRenamer web UI. Page bootstrap values come from window.MAGICRENAMER.
+let imageFiles = [];
+let imageInfo = {};
+let imageProblems = {};
+let imageRejected = {};
+let sourceIsArchive = false;
+let currentBrowsePath = window.MAGICRENAMER.currentDir;
+let selectedResizeSize = '';
+
+function selectResize(size) {
+    selectedResizeSize = size;
+    document.querySelectorAll('.resize-option').forEach(function(opt) {
+        if (opt.dataset.size === size) {
+            opt.classList.add('selected');
+        } else {
+            opt.classList.remove('selected');
+        }
+    });
+}
+
+function openBrowser() {
+    currentBrowsePath = document.getElementById('directory').value || window.MAGICRENAMER.currentDir;
+    document.getElementById('dirModal').classList.add('active');
+    loadDirectories(currentBrowsePath);
+}
+
+function closeBrowser() {
+    document.getElementById('dirModal').classList.remove('active');
+}
+
+// Select "No resize" by default on page load
+window.addEventListener('DOMContentLoaded', function() {
+    selectResize('');
+});
+
+async function loadDirectories(path) {
+    try {
+        const response = await fetch('/browse', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ path: path })
+        });
+
+        const data = await response.json();
+
+        if (data.success) {
+            currentBrowsePath = data.current_path;
+            document.getElementById('currentPath').textContent = data.current_path;
+
+            const dirList = document.getElementById('dirList');
+            dirList.innerHTML = '';
+
+            // Add parent directory option
+            if (data.parent) {
+                const parentDiv = document.createElement('div');
+                parentDiv.className = 'dir-item parent';
+                parentDiv.textContent = '📁 .. (parent directory)';
+                parentDiv.onclick = function() { loadDirectories(data.parent); };
+                dirList.appendChild(parentDiv);
+            }
+
+            // Add "Select this directory" button
+            const selectBtn = document.createElement('button');
+            selectBtn.className = 'btn btn-primary';
+            selectBtn.style.width = '100%';
+            selectBtn.style.marginBottom = '16px';
+            selectBtn.textContent = '✓ select this directory';
+            selectBtn.onclick = function() {
+                document.getElementById('directory').value = currentBrowsePath;
+                closeBrowser();
+                scanDirectory();
+            };
+            dirList.appendChild(selectBtn);
+
+            // Add subdirectories
+            data.directories.forEach(function(dir) {
+                const dirDiv = document.createElement('div');
+                dirDiv.className = 'dir-item';
+                dirDiv.textContent = '📁 ' + dir;
+                dirDiv.onclick = function() { loadDirectories(data.current_path + '/' + dir); };
+                dirList.appendChild(dirDiv);
+            });
+
+            // Archives are used in place of a directory, without extracting them
+            (data.archives || []).forEach(function(archive) {
+                const archiveDiv = document.createElement('div');
+                archiveDiv.className = 'dir-item';
+                archiveDiv.textContent = '📦 ' + archive;
+                archiveDiv.onclick = function() {
+                    document.getElementById('directory').value = data.current_path + '/' + archive;
+                    closeBrowser();
+                    scanDirectory();
+                };
+                dirList.appendChild(archiveDiv);
+            });
+
+            if (data.directories.length === 0 && !data.parent) {
+                dirList.innerHTML += '<div class="empty-state">no subdirectories</div>';
+            }
+        } else {
+            alert('Error: ' + data.error);
+        }
+    } catch (error) {
+        alert('Error loading directories: ' + error.message);
+    }
+}
+
+function showStatus(message, type) {
+    const status = document.getElementById('status');
+    status.textContent = message;
+    status.className = 'status ' + type;
+    status.style.display = 'block';
+}
+
+function addLog(message, type) {
+    type = type || '';
+    const logWindow = document.getElementById('logWindow');
+    logWindow.style.display = 'block';
+    const line = document.createElement('div');
+    line.className = 'log-line log-' + type;
+    line.textContent = message;
+    logWindow.appendChild(line);
+    logWindow.scrollTop = logWindow.scrollHeight;
+}
+
+function clearLog() {
+    document.getElementById('logWindow').innerHTML = '';
+    document.getElementById('logWindow').style.display = 'none';
+}
+
+function updateProgress(current, total, message) {
+    const progressBar = document.getElementById('progressBar');
+    const progressFill = document.getElementById('progressFill');
+    const progressText = document.getElementById('progressText');
+
+    progressBar.style.display = 'block';
+    const percentage = Math.round((current / total) * 100);
+    progressFill.style.width = percentage + '%';
+    progressFill.textContent = percentage + '%';
+    progressText.textContent = message || ('Processing ' + current + ' of ' + total + '...');
+}
+
+function formatDuration(seconds) {
+    seconds = Math.round(seconds);
+    if (seconds < 60) return seconds + 's';
+    if (seconds < 3600) return Math.floor(seconds / 60) + 'm ' + (seconds % 60) + 's';
+    return Math.floor(seconds / 3600) + 'h ' + Math.floor((seconds % 3600) / 60) + 'm';
+}
+
+function throughputText(data) {
+    if (data.images_per_sec === undefined) return '';
+    let text = ' · ' + data.images_per_sec.toFixed(1) + ' img/s · ' + data.mp_per_sec.toFixed(1) + ' MP/s';
+    if (data.eta !== null && data.current < data.total) text += ' · ETA ' + formatDuration(data.eta);
+    return text;
+}
+
+function hideProgress() {
+    document.getElementById('progressBar').style.display = 'none';
+}
+
+// Fixed tile geometry lets the grid compute which rows are visible
+// without measuring the DOM; keep in sync with .file-item / .file-list-window
+const TILE_MIN_WIDTH = 120;
+const TILE_HEIGHT = 146;
+const TILE_GAP = 16;
+const GRID_PADDING = 4;
+const OVERSCAN_ROWS = 2;
+
+let selection = null;
+let gridColumns = 1;
+let renderedRange = [-1, -1];
+let renderScheduled = false;
+
+// Selection bitset with a running count: toggles and counts are O(1)
+class SelectionSet {
+    constructor(size) {
+        this.size = size;
+        this.words = new Uint32Array(Math.ceil(size / 32));
+        this.count = 0;
+    }
+    has(i) {
+        return (this.words[i >>> 5] & (1 << (i & 31))) !== 0;
+    }
+    set(i, on) {
+        if (this.has(i) === on) return;
+        this.words[i >>> 5] ^= (1 << (i & 31));
+        this.count += on ? 1 : -1;
+    }
+    toggle(i) {
+        this.set(i, !this.has(i));
+    }
+    fill(on) {
+        this.words.fill(on ? 0xFFFFFFFF : 0);
+        if (on && this.size % 32) {
+            this.words[this.words.length - 1] = (2 ** (this.size % 32)) - 1;
+        }
+        this.count = on ? this.size : 0;
+    }
+}
+
+function updateSelectionCount() {
+    const selected = selection ? selection.count : 0;
+    const total = selection ? selection.size : 0;
+    document.getElementById('selectionCount').textContent = selected + ' of ' + total + ' selected';
+}
+
+function syncVisibleCheckboxes() {
+    document.querySelectorAll('#fileListWindow .file-item').forEach(function(tile) {
+        tile.querySelector('.file-item-checkbox').checked = selection.has(Number(tile.dataset.index));
+    });
+}
+
+function selectAll() {
+    if (!selection) return;
+    selection.fill(true);
+    syncVisibleCheckboxes();
+    updateSelectionCount();
+}
+
+function deselectAll() {
+    if (!selection) return;
+    selection.fill(false);
+    syncVisibleCheckboxes();
+    updateSelectionCount();
+}
+
+async function scanDirectory() {
+    const directory = document.getElementById('directory').value;
+    showStatus('Scanning directory...', 'info');
+
+    try {
+        const response = await fetch('/scan', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                directory: directory,
+                validate: document.getElementById('validateFiles').checked,
+                prefilter: document.getElementById('prefilterFiles').checked,
+                resize_size: selectedResizeSize
+            })
+        });
+
+        const data = await response.json();
+
+        if (data.success) {
+            imageFiles = data.files;
+            imageInfo = data.info || {};
+            imageProblems = data.problems || {};
+            imageRejected = data.rejected || {};
+            sourceIsArchive = !!data.archive;
+            // Plans are built from files on disk; archive members aren't
+            const planButton = document.getElementById('planButton');
+            planButton.disabled = sourceIsArchive;
+            planButton.title = sourceIsArchive ? 'Dry runs are only available for directory sources' : '';
+            renderFileList(data.files);
+            const broken = Object.values(imageProblems).filter(function(p) { return p.error; }).length;
+            const rejected = Object.keys(imageRejected).length;
+            showStatus('Found ' + data.files.length + ' images' +
+                (broken ? ' (' + broken + ' broken, left unselected)' : '') +
+                (rejected ? ' (' + rejected + ' tiny, blank or blurry, left unselected)' : ''),
+                broken || rejected ? 'info' : 'success');
+        } else {
+            showStatus(data.error, 'error');
+        }
+    } catch (error) {
+        showStatus('Error scanning directory: ' + error.message, 'error');
+    }
+}
+
+function renderFileList(files) {
+    const fileList = document.getElementById('fileList');
+    selection = new SelectionSet(files.length);
+    selection.fill(true);
+    // Broken files would only fail mid-job and rejected ones are rarely
+    // wanted; both stay selectable by hand
+    files.forEach(function(file, idx) {
+        if ((imageProblems[file] && imageProblems[file].error) || imageRejected[file]) selection.set(idx, false);
+    });
+    renderedRange = [-1, -1];
+    fileList.scrollTop = 0;
+
+    if (files.length === 0) {
+        fileList.innerHTML = '<div class="empty-state">No images found</div>';
+        fileList.classList.add('empty');
+        updateSelectionCount();
+        return;
+    }
+
+    fileList.classList.remove('empty');
+    fileList.innerHTML = '<div class="file-list-spacer" id="fileListSpacer">' +
+        '<div class="file-list-window" id="fileListWindow"></div></div>';
+
+    layoutFileGrid();
+    updateSelectionCount();
+}
+
+function layoutFileGrid() {
+    const fileList = document.getElementById('fileList');
+    const spacer = document.getElementById('fileListSpacer');
+    if (!spacer) return;
+
+    const width = fileList.clientWidth - GRID_PADDING * 2;
+    gridColumns = Math.max(1, Math.floor((width + TILE_GAP) / (TILE_MIN_WIDTH + TILE_GAP)));
+    const rows = Math.ceil(imageFiles.length / gridColumns);
+    spacer.style.height = (rows * (TILE_HEIGHT + TILE_GAP) - TILE_GAP + GRID_PADDING * 2) + 'px';
+    document.getElementById('fileListWindow').style.gridTemplateColumns = 'repeat(' + gridColumns + ', 1fr)';
+
+    renderedRange = [-1, -1];
+    renderVisibleTiles();
+}
+
+function scheduleRender() {
+    if (renderScheduled) return;
+    renderScheduled = true;
+    requestAnimationFrame(function() {
+        renderScheduled = false;
+        renderVisibleTiles();
+    });
+}
+
+// Only the rows in (or near) the viewport exist in the DOM
+function renderVisibleTiles() {
+    const fileList = document.getElementById('fileList');
+    const windowEl = document.getElementById('fileListWindow');
+    if (!windowEl) return;
+
+    const rowHeight = TILE_HEIGHT + TILE_GAP;
+    const totalRows = Math.ceil(imageFiles.length / gridColumns);
+    const firstRow = Math.max(0, Math.floor(fileList.scrollTop / rowHeight) - OVERSCAN_ROWS);
+    const lastRow = Math.min(totalRows, Math.ceil((fileList.scrollTop + fileList.clientHeight) / rowHeight) + OVERSCAN_ROWS);
+    const start = firstRow * gridColumns;
+    const end = Math.min(imageFiles.length, lastRow * gridColumns);
+
+    if (start === renderedRange[0] && end === renderedRange[1]) return;
+    renderedRange = [start, end];
+
+    const directory = document.getElementById('directory').value;
+    const fragment = document.createDocumentFragment();
+    for (let idx = start; idx < end; idx++) {
+        fragment.appendChild(createFileTile(imageFiles[idx], idx, directory));
+    }
+    windowEl.style.transform = 'translateY(' + (firstRow * rowHeight) + 'px)';
+    windowEl.replaceChildren(fragment);
+}
+
+function createFileTile(file, idx, directory) {
+    const tile = document.createElement('div');
+    tile.className = 'file-item';
+    tile.dataset.index = idx;
+
+    const checkbox = document.createElement('input');
+    checkbox.type = 'checkbox';
+    checkbox.className = 'file-item-checkbox';
+    checkbox.checked = selection.has(idx);
+    tile.appendChild(checkbox);
+
+    const img = document.createElement('img');
+    img.className = 'file-item-image';
+    img.loading = 'lazy';
+    img.decoding = 'async';
+    img.alt = file;
+    img.src = '/image?dir=' + encodeURIComponent(directory) + '&file=' + encodeURIComponent(file);
+    tile.appendChild(img);
+
+    const info = imageInfo[file];
+    if (info && info.frames > 1) {
+        const badge = document.createElement('div');
+        badge.className = 'file-item-frames';
+        badge.textContent = info.frames + ' frames';
+        tile.appendChild(badge);
+    }
+
+    const problem = imageProblems[file];
+    if (problem) {
+        tile.classList.add(problem.error ? 'file-item-broken' : 'file-item-warning');
+        tile.title = problem.error || problem.warning;
+        const flag = document.createElement('div');
+        flag.className = 'file-item-problem';
+        flag.textContent = problem.error ? 'broken' : 'misnamed';
+        tile.appendChild(flag);
+    } else if (imageRejected[file]) {
+        tile.classList.add('file-item-rejected');
+        tile.title = imageRejected[file].detail;
+        const flag = document.createElement('div');
+        flag.className = 'file-item-problem';
+        flag.textContent = imageRejected[file].reject;
+        tile.appendChild(flag);
+    }
+
+    const name = document.createElement('div');
+    name.className = 'file-item-name';
+    name.textContent = file;
+    name.title = file;
+    tile.appendChild(name);
+    return tile;
+}
+
+// One delegated listener handles every tile, rendered or not yet rendered
+function handleFileListClick(event) {
+    const tile = event.target.closest('.file-item');
+    if (!tile || !selection) return;
+    const idx = Number(tile.dataset.index);
+    const checkbox = tile.querySelector('.file-item-checkbox');
+
+    if (event.target === checkbox) {
+        selection.set(idx, checkbox.checked);
+    } else {
+        selection.toggle(idx);
+        checkbox.checked = selection.has(idx);
+    }
+    updateSelectionCount();
+}
+
+window.addEventListener('DOMContentLoaded', function() {
+    const fileList = document.getElementById('fileList');
+    fileList.addEventListener('scroll', scheduleRender, { passive: true });
+    fileList.addEventListener('click', handleFileListClick);
+    window.addEventListener('resize', layoutFileGrid);
+});
+
+async function fetchBucketHistogram(directory, files, resizeSize) {
+    try {
+        const response = await fetch('/buckets', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ directory: directory, files: files, resize_size: resizeSize })
+        });
+        const data = await response.json();
+        if (!data.success) {
+            showStatus(data.error, 'error');
+            return null;
+        }
+        return data.histogram;
+    } catch (error) {
+        showStatus('Error computing buckets: ' + error.message, 'error');
+        return null;
+    }
+}
+
+const PLAN_LOG_LIMIT = 500;
+
+function formatBytes(bytes) {
+    if (bytes >= 1024 * 1024 * 1024) return (bytes / 1024 / 1024 / 1024).toFixed(1) + ' GB';
+    if (bytes >= 1024 * 1024) return (bytes / 1024 / 1024).toFixed(1) + ' MB';
+    return Math.round(bytes / 1024) + ' KB';
+}
+
+async function planImages() {
+    const selectedFiles = imageFiles.filter(function(file, idx) { return selection && selection.has(idx); });
+    if (selectedFiles.length === 0) {
+        showStatus('No images selected', 'error');
+        return;
+    }
+
+    showStatus('Planning...', 'info');
+    try {
+        const response = await fetch('/plan', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                directory: document.getElementById('directory').value,
+                prefix: document.getElementById('prefix').value,
+                files: selectedFiles,
+                resize_size: selectedResizeSize,
+                crop_mode: document.getElementById('cropMode').value,
+                quality: document.getElementById('quality').value,
+                bucket: document.getElementById('aspectBuckets').checked && !!selectedResizeSize,
+                output_dir: document.getElementById('outputDir').value.trim(),
+                append: document.getElementById('appendMode').checked
+            })
+        });
+        const data = await response.json();
+        if (!data.success) {
+            showStatus(data.error, 'error');
+            return;
+        }
+
+        clearLog();
+        addLog('--- Dry run (nothing is changed) ---', 'info');
+        data.entries.slice(0, PLAN_LOG_LIMIT).forEach(function(e) {
+            if (e.error) {
+                addLog('✗ ' + e.source + ': ' + e.error, 'error');
+                return;
+            }
+            let line = e.source + ' -> ' + e.name + ' (' + e.output_width + 'x' + e.output_height;
+            if (e.crop) line += ', crop ' + e.crop.width + 'x' + e.crop.height + '+' + e.crop.x + '+' + e.crop.y;
+            if (e.passthrough) line += ', kept as-is';
+            addLog(line + ')');
+        });
+        if (data.entries.length > PLAN_LOG_LIMIT) {
+            addLog('... and ' + (data.entries.length - PLAN_LOG_LIMIT) + ' more');
+        }
+        const totals = data.totals;
+        showStatus('Plan: ' + totals.files + ' images, ~' + formatBytes(totals.estimated_bytes) +
+            ' output, ~' + Math.ceil(totals.estimated_seconds) + 's' +
+            (totals.passthrough ? ', ' + totals.passthrough + ' kept as-is' : '') +
+            (totals.existing ? ', ' + totals.existing + ' existing outputs untouched' : '') +
+            (totals.errors ? ', ' + totals.errors + ' unreadable' : ''), 'info');
+    } catch (error) {
+        showStatus('Error planning job: ' + error.message, 'error');
+    }
+}
+
+async function processImages() {
+    const directory = document.getElementById('directory').value;
+    const prefix = document.getElementById('prefix').value;
+    const resizeSize = selectedResizeSize;
+    const cropMode = document.getElementById('cropMode').value;
+    const skipConfirm = document.getElementById('skipConfirm').checked;
+    // Archive members are resized to the plain square size, never bucketed
+    const bucketMode = document.getElementById('aspectBuckets').checked && !!resizeSize && !sourceIsArchive;
+    const outputDir = document.getElementById('outputDir').value.trim();
+    const appendMode = document.getElementById('appendMode').checked;
+
+    const selectedFiles = imageFiles.filter(function(file, idx) { return selection && selection.has(idx); });
+
+    if (selectedFiles.length === 0) {
+        showStatus('No images selected', 'error');
+        return;
+    }
+
+    if (sourceIsArchive && !outputDir) {
+        showStatus('Archives are never modified: set an output directory (or a .zip/.tar path)', 'error');
+        return;
+    }
+
+    let bucketLines = [];
+    if (bucketMode) {
+        const histogram = await fetchBucketHistogram(directory, selectedFiles, resizeSize);
+        if (!histogram) return;
+        bucketLines = histogram.map(function(b) { return b.width + 'x' + b.height + ': ' + b.count; });
+    }
+
+    if (!skipConfirm) {
+        const naming = appendMode ? 'continuing after the existing ' + (prefix ? prefix + '-N.png' : 'N.png') + ' files' :
+            (prefix ? (prefix + '-1.png, ' + prefix + '-2.png, ...') : '1.png, 2.png, ...');
+        var msg = 'This will process ' + selectedFiles.length + ' selected images:';
+        msg += String.fromCharCode(10) + String.fromCharCode(10);
+        let step = 1;
+        msg += step++ + '. Convert to PNG format' + String.fromCharCode(10);
+
+        if (bucketMode) {
+            msg += step++ + '. Resize to aspect-ratio buckets within ' + resizeSize + 'x' + resizeSize + ' pixels (' + cropMode + ' crop):' + String.fromCharCode(10);
+            bucketLines.forEach(function(line) { msg += '     ' + line + String.fromCharCode(10); });
+        } else if (resizeSize) {
+            msg += step++ + '. Resize to ' + resizeSize + 'x' + resizeSize + ' (' + cropMode + ' crop)' + String.fromCharCode(10);
+        }
+        if (outputDir) {
+            msg += step++ + '. Write results to ' + outputDir + ' (originals are kept)' + String.fromCharCode(10);
+        } else {
+            msg += step++ + '. Delete original files' + String.fromCharCode(10);
+        }
+        msg += step++ + '. Rename sequentially: ' + naming + String.fromCharCode(10) + String.fromCharCode(10);
+
+        if (!outputDir) {
+            msg += 'WARNING: This action cannot be undone!' + String.fromCharCode(10) + String.fromCharCode(10);
+        }
+        msg += 'Continue?';
+
+        if (!confirm(msg)) return;
+    }
+
+    clearLog();
+    hideProgress();
+    showStatus('Processing images...', 'info');
+    updateProgress(0, selectedFiles.length, 'Starting...');
+
+    try {
+        const response = await fetch('/process', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ 
+                directory: directory, 
+                prefix: prefix, 
+                files: selectedFiles,
+                resize_size: resizeSize,
+                crop_mode: cropMode,
+                quality: document.getElementById('quality').value,
+                bucket: bucketMode,
+                output_dir: outputDir,
+                append: appendMode
+            })
+        });
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+
+        while (true) {
+            const result = await reader.read();
+            if (result.done) break;
+
+            const text = decoder.decode(result.value);
+            const lines = text.split(String.fromCharCode(10)).filter(function(l) { return l.trim(); });
+
+            for (let i = 0; i < lines.length; i++) {
+                const line = lines[i];
+                if (line.startsWith('data: ')) {
+                    const data = JSON.parse(line.substring(6));
+
+                    if (data.progress) {
+                        updateProgress(data.current, data.total, data.message + throughputText(data));
+                    }
+
+                    if (data.log) {
+                        if (data.log.startsWith('✓')) addLog(data.log, 'success');
+                        else if (data.log.startsWith('✗')) addLog(data.log, 'error');
+                        else if (data.log.startsWith('---')) addLog(data.log, 'info');
+                        else addLog(data.log);
+                    }
+
+                    if (data.complete) {
+                        hideProgress();
+                        if (data.stats && data.stats.memory_budget_mb) {
+                            addLog('--- Job stats ---', 'info');
+                            addLog(data.stats.workers + ' workers, peak memory ' + data.stats.peak_memory_mb + ' MB of ' +
+                                data.stats.memory_budget_mb + ' MB budget (' + Math.round(data.stats.peak_utilization * 100) +
+                                '% peak, ' + Math.round(data.stats.average_utilization * 100) + '% average)');
+                            if (data.stats.oversized_tasks) {
+                                addLog(data.stats.oversized_tasks + ' oversized images ran alone');
+                            }
+                            if (data.stats.task_timeouts || data.stats.worker_crashes) {
+                                addLog(data.stats.task_timeouts + ' images timed out, ' + data.stats.worker_crashes +
+                                    ' worker crashes (workers replaced)', 'error');
+                            }
+                            if (data.stats.worker_recycles) {
+                                addLog(data.stats.worker_recycles + ' workers recycled');
+                            }
+                        }
+                        showStatus('✓ Successfully processed ' + data.processed + ' images!' +
+                            (data.skipped ? ' (' + data.skipped + ' already conforming, not re-encoded)' : ''), 'success');
+                        await scanDirectory();
+                    }
+
+                    if (data.error) {
+                        hideProgress();
+                        showStatus('Error: ' + data.error, 'error');
+                    }
+                }
+            }
+        }
+    } catch (error) {
+        hideProgress();
+        showStatus('Error processing images: ' + error.message, 'error');
+    }
+}
+
+// Auto-scan on load
+window.onload = function() { scanDirectory(); };